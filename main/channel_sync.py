@@ -0,0 +1,181 @@
+# channel_sync.py queues only the new uploads of channels and uploads playlists, using a stored per-source watermark.
+
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable
+
+from logging_setup import log
+from constants import SYNC_SEEN_IDS, SYNC_MAX_SCAN
+from job_queue import JobQueueBackend, SQLiteDatabase
+from video_record import iter_flat_entries
+from error_report import job_context, record_error
+
+# A channel URL without a tab lists the tabs (Videos, Shorts, Live) instead of the uploads
+_CHANNEL_ROOT = re.compile(r'^(https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+))/?$')
+# Flat entries that are not a finished video yet: scheduled premieres/streams, running streams, streams still processing
+_NOT_FINISHED = ('is_upcoming', 'is_live', 'post_live')
+
+# Sources YouTube lists newest first: the upload tabs of a channel and its uploads playlists (IDs starting with UU).
+# Other playlists are usually oldest first or in curated order, so a sync could not stop at the watermark.
+_NEWEST_FIRST = (
+    re.compile(r'^https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+)/(?:videos|shorts|streams)/?(?:[?#].*)?$'),
+    re.compile(r'^https?://(?:www\.|m\.)?youtube\.com/playlist\?(?:.*&)?list=UU[\w-]+(?:&.*)?$'),
+)
+
+@dataclass(slots=True)
+class Watermark:
+    """What a source looked like at its last sync: its newest video IDs (newest first) and their latest upload date.
+
+    Only seen_ids decides where a sync stops; upload_date is kept for reference.
+    """
+    source: str
+    seen_ids: tuple[str, ...]
+    upload_date: str | None
+    synced: float
+
+class WatermarkStore:
+    """Watermarks stored in a SQLite file, one row per source."""
+    def __init__(self, path: str):
+        self._db = SQLiteDatabase(path)
+        self.path = self._db.path
+        with self._db.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks ("
+                " source TEXT PRIMARY KEY,"
+                " seen_ids TEXT NOT NULL,"
+                " upload_date TEXT,"
+                " synced REAL NOT NULL)"
+            )
+
+    def get(self, source: str) -> Watermark | None:
+        with self._db.transaction() as conn:
+            row = conn.execute("SELECT seen_ids, upload_date, synced FROM watermarks WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            return None
+        return Watermark(source, tuple(json.loads(row[0])), row[1], row[2])
+
+    def put(self, watermark: Watermark):
+        with self._db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO watermarks (source, seen_ids, upload_date, synced) VALUES (?, ?, ?, ?)",
+                (watermark.source, json.dumps(list(watermark.seen_ids)), watermark.upload_date, watermark.synced),
+            )
+
+    def sources(self) -> list[str]:
+        with self._db.transaction() as conn:
+            return [row[0] for row in conn.execute("SELECT source FROM watermarks ORDER BY source")]
+
+def uploads_url(url: str) -> str:
+    """Return the uploads tab of a channel URL; other URLs are returned unchanged."""
+    match = _CHANNEL_ROOT.match(url)
+    return f"{match.group(1)}/videos" if match else url
+
+def sync_url(source: str) -> str:
+    """Return the newest-first listing to read for source, or raise ValueError if it cannot be synced.
+
+    Accepted are channel URLs (their Videos tab is read), channel tabs
+    (/videos, /shorts, /streams) and uploads playlists (list=UU...).
+    """
+    url = uploads_url(source)
+    if not any(pattern.match(url) for pattern in _NEWEST_FIRST):
+        raise ValueError(f"Only channels, channel tabs and uploads playlists can be synced, not {source}; "
+                         "other playlists are not listed newest first.")
+    return url
+
+def _entry_date(entry: dict) -> str | None:
+    # Flat entries carry an upload_date or a (possibly approximate) timestamp, if anything
+    if entry.get('upload_date'):
+        return entry['upload_date']
+    if entry.get('timestamp'):
+        return datetime.fromtimestamp(entry['timestamp'], timezone.utc).strftime('%Y%m%d')
+    return None
+
+def _entry_url(entry: dict) -> str:
+    return entry.get('url') or entry.get('webpage_url') or f"https://www.youtube.com/watch?v={entry['id']}"
+
+def sync_source(
+    source: str,
+    store: WatermarkStore,
+    queue: JobQueueBackend,
+    payload: dict | None = None,
+    backfill: int = 0,
+    max_scan: int = SYNC_MAX_SCAN,
+    cookies_path: str | None = None,
+) -> list[int]:
+    """Queue the uploads of source that are newer than its watermark and return the new job IDs.
+
+    source must be accepted by sync_url. Entries are read newest first and only
+    until one is reached that the watermark has seen (or max_scan entries), so a
+    poll usually fetches a single page. There is no date cutoff, so an older
+    video that becomes public late is still queued. Upcoming premieres and
+    streams that are live or still processing are neither queued nor added to
+    the watermark, so they are picked up once they are finished. The first sync
+    only records the watermark and queues the newest backfill entries. Jobs are
+    queued oldest first with payload as defaults; the watermark is written after
+    queueing, so a crash in between queues those entries again on the next sync
+    rather than losing them.
+    """
+    url = sync_url(source)
+    watermark = store.get(source)
+    seen = set(watermark.seen_ids) if watermark else set()
+    new_entries = []
+    scanned = skipped = 0
+    for entry in iter_flat_entries(url, cookies_path):
+        if not entry.get('id'):
+            continue
+        scanned += 1
+        if entry['id'] in seen:
+            break
+        if entry.get('live_status') in _NOT_FINISHED:
+            # Downloading now would fail ("Premieres in ...") and remembering the ID would skip it for good
+            skipped += 1
+        else:
+            new_entries.append(entry)
+            if watermark is None and len(new_entries) >= max(backfill, SYNC_SEEN_IDS):
+                break
+        if scanned >= max_scan:
+            log.warning(f"[channel_sync] Read {scanned} entries of {source} without reaching its watermark; stopping there.")
+            break
+
+    to_queue = new_entries if watermark else new_entries[:backfill]
+    job_ids = [queue.enqueue({**(payload or {}), 'url': _entry_url(entry), 'source': source}) for entry in reversed(to_queue)]
+
+    ids = [entry['id'] for entry in new_entries] + list(watermark.seen_ids if watermark else ())
+    dates = [d for d in [watermark.upload_date if watermark else None, *map(_entry_date, new_entries)] if d]
+    store.put(Watermark(source, tuple(dict.fromkeys(ids))[:SYNC_SEEN_IDS], max(dates, default=None), time.time()))
+    log.info(f"[channel_sync] {source}: read {scanned} entries, queued {len(job_ids)} new, skipped {skipped} not yet finished.")
+    return job_ids
+
+def sync_sources(sources: Iterable[str], store: WatermarkStore, queue: JobQueueBackend, payload: dict | None = None,
+                 backfill: int = 0, cookies_path: str | None = None) -> dict[str, int]:
+    """Sync every source and return the number of queued jobs per source.
+
+    A source that fails is recorded in error_report and skipped; the others still sync.
+    """
+    queued = {}
+    for source in sources:
+        with job_context(source):
+            try:
+                queued[source] = len(sync_source(source, store, queue, payload, backfill, cookies_path=cookies_path))
+            except Exception as e:
+                log.error(f"[channel_sync] Could not sync {source}: {e}")
+                record_error(e, "error", f"Could not sync {source}", __file__)
+    return queued
+
+if __name__ == "__main__":
+    # Example usage: sync one channel twice; the second run reads one page and queues nothing new
+    import sys
+    import tempfile
+    from job_queue import SQLiteJobQueue
+
+    workdir = tempfile.mkdtemp()
+    queue = SQLiteJobQueue(os.path.join(workdir, 'jobs.db'))
+    store = WatermarkStore(os.path.join(workdir, 'sync.db'))
+    channel = sys.argv[1] if len(sys.argv) > 1 else "https://www.youtube.com/@YouTube"
+    for _ in range(2):
+        print(sync_sources([channel], store, queue, {'format': 'mp4'}, backfill=3))
+    print(store.get(channel))
@@ -6,4 +6,12 @@ WARNING_TITLE = f"WARNING - YouTube Downloader v{PROGRAM_VERSION}"
 ERROR_TITLE = f'ERROR - YouTube Downloader v{PROGRAM_VERSION}'
 
 ISSUE_INFO = "If the issue persists,\nPlease open an issue on GitHub\n'Akeoottt/YouTube-Downloader/issues'"
-ISSUE_INFO_HTML = "<b>If</b> the issue persists,<br>Please open an issue on GitHub<br>'Akeoottt/YouTube-Downloader/issues'"
\ No newline at end of file
+ISSUE_INFO_HTML = "<b>If</b> the issue persists,<br>Please open an issue on GitHub<br>'Akeoottt/YouTube-Downloader/issues'"
+
+# Segment-parallel transcoding of long audio (seconds)
+SEGMENT_TRANSCODE_MIN_DURATION = 20 * 60
+SEGMENT_TRANSCODE_SEGMENT_SECONDS = 5 * 60
+
+# Channel sync: video IDs kept per source as the watermark, and entries read per sync before giving up on finding it
+SYNC_SEEN_IDS = 50
+SYNC_MAX_SCAN = 500
@@ -0,0 +1,219 @@
+# dashboard.py shows the progress of many concurrent download jobs in one window.
+
+import threading
+import tkinter as tk
+import tkinter.ttk as ttk
+from dataclasses import dataclass
+from itertools import zip_longest
+from typing import Callable
+
+from logging_setup import log
+from constants import INFO_TITLE
+
+FRAME_MS = 250
+STATUS_INTERVAL = 2.0
+VISIBLE_ROWS = 20
+COLUMNS = (
+    ("job", "Job", 60),
+    ("title", "Title", 300),
+    ("phase", "Phase", 100),
+    ("progress", "Progress", 80),
+    ("speed", "Speed", 90),
+    ("eta", "ETA", 70),
+    ("error", "Error", 260),
+)
+
+@dataclass(slots=True)
+class JobState:
+    """Latest known progress of one job."""
+    job_id: int | str
+    title: str = ""
+    phase: str = "queued"
+    percent: float = 0.0
+    speed: float | None = None
+    eta: int | None = None
+    error: str = ""
+
+    def row(self) -> tuple[str, ...]:
+        return (
+            str(self.job_id),
+            self.title,
+            self.phase,
+            f"{self.percent:.1f}%",
+            f"{self.speed/1024/1024:.2f} MB/s" if self.speed else "",
+            f"{self.eta}s" if self.eta is not None and self.phase == "downloading" else "",
+            self.error,
+        )
+
+class JobStateStore:
+    """Thread-safe progress state of all jobs.
+
+    Progress hooks only overwrite a few fields here; the dashboard reads the
+    aggregated state once per frame instead of redrawing on every hook call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: dict[int | str, JobState] = {}
+        self._order: list[int | str] = []
+        self.version = 0
+
+    def _state(self, job_id: int | str) -> JobState:
+        # Caller holds the lock
+        state = self._jobs.get(job_id)
+        if state is None:
+            state = self._jobs[job_id] = JobState(job_id)
+            self._order.append(job_id)
+        return state
+
+    def start(self, job_id: int | str, title: str):
+        with self._lock:
+            state = self._state(job_id)
+            state.title, state.phase, state.percent, state.error = title, "starting", 0.0, ""
+            self.version += 1
+
+    def update_from_hook(self, job_id: int | str, d: dict):
+        """Record a yt_dlp progress hook dict for the job."""
+        with self._lock:
+            state = self._state(job_id)
+            title = (d.get('info_dict') or {}).get('title')
+            if title:
+                state.title = title
+            if d['status'] == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total:
+                    state.percent = d.get('downloaded_bytes', 0) / total * 100
+                state.phase, state.speed, state.eta = "downloading", d.get('speed'), d.get('eta')
+            elif d['status'] == 'finished':
+                state.phase, state.percent, state.speed = "processing", 100.0, None
+            self.version += 1
+
+    def set_phase(self, job_id: int | str, phase: str, error: str = ""):
+        with self._lock:
+            state = self._state(job_id)
+            state.phase, state.error = phase, error
+            if phase == "done":
+                state.percent, state.speed = 100.0, None
+            self.version += 1
+
+    def rows(self, start: int, count: int) -> tuple[int, list[tuple[str, ...]]]:
+        """Return the total number of jobs and the formatted rows [start, start + count)."""
+        with self._lock:
+            ids = self._order[start:start + count]
+            return len(self._order), [self._jobs[job_id].row() for job_id in ids]
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for state in self._jobs.values():
+                counts[state.phase] = counts.get(state.phase, 0) + 1
+            return counts
+
+class JobDashboard:
+    """Tk window listing jobs with phase, progress, speed, ETA and errors.
+
+    Redraws at most every FRAME_MS and only fills the VISIBLE_ROWS rows that are
+    on screen, so hundreds of jobs cost no more than twenty. extra_status may
+    be slow (it can query the job queue), so it is polled every STATUS_INTERVAL
+    on a background thread and the Tk thread only shows its latest text.
+    """
+    def __init__(self, store: JobStateStore, extra_status: Callable[[], str] | None = None):
+        self.store = store
+        self.extra_status = extra_status
+        self._offset = 0
+        self._total = 0
+        self._drawn_version = -1
+        self._dirty = True
+        self._status_text = ""
+        self._drawn_status = ""
+        self._closed = threading.Event()
+
+        self.root = tk.Tk()
+        self.root.title(f"Downloads - {INFO_TITLE}")
+        self.root.geometry("980x520")
+        frame = ttk.Frame(self.root)
+        frame.pack(expand=True, fill="both", padx=10, pady=(10, 5))
+        self.tree = ttk.Treeview(frame, columns=[c[0] for c in COLUMNS], show="headings", height=VISIBLE_ROWS, selectmode="none")
+        for key, heading, width in COLUMNS:
+            self.tree.heading(key, text=heading)
+            self.tree.column(key, width=width, stretch=key in ("title", "error"))
+        self.scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self._on_scroll)
+        self.tree.pack(side="left", expand=True, fill="both")
+        self.scrollbar.pack(side="right", fill="y")
+        self.summary_label = tk.Label(self.root, text="", anchor="w", justify="left")
+        self.summary_label.pack(fill="x", padx=10, pady=(0, 10))
+        # Fixed set of row items; scrolling only changes which jobs they show
+        self._items = [self.tree.insert("", "end", values=("",) * len(COLUMNS)) for _ in range(VISIBLE_ROWS)]
+        self.tree.bind("<MouseWheel>", lambda e: self._scroll_by(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-1))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(1))
+
+    def _scroll_by(self, rows: int):
+        self._set_offset(self._offset + rows)
+
+    def _set_offset(self, offset: int):
+        offset = max(0, min(offset, max(0, self._total - VISIBLE_ROWS)))
+        if offset != self._offset:
+            self._offset = offset
+            self._dirty = True
+
+    def _on_scroll(self, action: str, value: str, unit: str | None = None):
+        # Scrollbar callback: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if action == "moveto":
+            self._set_offset(round(float(value) * self._total))
+        elif action == "scroll":
+            self._scroll_by(int(value) * (VISIBLE_ROWS if unit == "pages" else 1))
+
+    def _poll_status(self):
+        # Runs on its own thread until the window closes; the Tk thread picks up _status_text
+        while not self._closed.is_set():
+            try:
+                text = self.extra_status() # type: ignore
+            except Exception as e:
+                log.warning(f"[dashboard] Status update failed: {e}")
+            else:
+                self._status_text = text
+            self._closed.wait(STATUS_INTERVAL)
+
+    def _redraw(self):
+        # Runs once per frame on the Tk thread
+        try:
+            self._draw()
+        finally:
+            # A failed frame must not stop later ones
+            self.root.after(FRAME_MS, self._redraw)
+
+    def _draw(self):
+        version = self.store.version
+        status = self._status_text
+        if self._dirty or version != self._drawn_version or status != self._drawn_status:
+            self._total, rows = self.store.rows(self._offset, VISIBLE_ROWS)
+            for item, row in zip_longest(self._items, rows):
+                self.tree.item(item, values=row or ("",) * len(COLUMNS))
+            if self._total > VISIBLE_ROWS:
+                self.scrollbar.set(self._offset / self._total, (self._offset + VISIBLE_ROWS) / self._total)
+            else:
+                self.scrollbar.set(0, 1)
+            counts = ", ".join(f"{phase}: {n}" for phase, n in sorted(self.store.counts().items()))
+            self.summary_label.config(text=f"Jobs {self._total} ({counts})  {status}")
+            self._drawn_version = version
+            self._drawn_status = status
+            self._dirty = False
+
+    def run(self, on_close: Callable[[], None] | None = None):
+        """Show the dashboard until the window is closed."""
+        log.info("[dashboard] Showing job dashboard.")
+
+        def close():
+            self._closed.set()
+            if on_close:
+                on_close()
+            self.root.destroy()
+
+        self.root.protocol("WM_DELETE_WINDOW", close)
+        if self.extra_status:
+            threading.Thread(target=self._poll_status, daemon=True, name="dashboard-status").start()
+        self.root.after(0, self._redraw)
+        try:
+            self.root.mainloop()
+        finally:
+            self._closed.set()
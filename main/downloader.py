@@ -1,13 +1,24 @@
+import errno
+import filecmp
 import os
+import shutil
 import sys
 import tkinter as tk
 from tkinter import messagebox as msgbox
 from tkinter import filedialog
 import tkinter.ttk as ttk
+from typing import Callable
 import yt_dlp
 from logging_setup import log
 from constants import ERROR_TITLE
 from error_handler import gather_info
+from segment_transcode import ExtractAudioPP
+from integrity import HashingYoutubeDL, hash_file, verify_container
+from ffmpeg_utils import FFmpegError, ffprobe_path_for
+from profiling import profile_phase, profiled
+from sidecars import SidecarFetch, embed_sidecars
+from stream_merge import can_stream_merge, stream_merge
+from staging import finalize_to_destination, make_staging_dir
 
 def get_cookies_file_path():
     """Return path to cookies file if it exists, else None."""
@@ -28,39 +39,61 @@ class YTDlpLogger:
 
 class DownloadYT:
     """Handles downloading of YouTube videos or audio using yt_dlp."""
-    def __init__(self, download_info: list[str], cookies_path: str | None = None):
-        log.info(f"DownloadYT initialized with info: {download_info}, cookies_path: {cookies_path}")
+    def __init__(self, download_info: list[str], cookies_path: str | None = None, segment_transcode: bool = False,
+                 directory: str | None = None, show_progress: bool = True,
+                 sidecars: tuple[str, ...] = (), embed_sidecars: bool = False,
+                 progress_callback: Callable[[dict], None] | None = None, verify: bool = False,
+                 stream_merge: bool = False, staging_dir: str | None = None):
+        log.info(f"DownloadYT initialized with info: {download_info}, cookies_path: {cookies_path}, segment_transcode: {segment_transcode}, directory: {directory}, stream_merge: {stream_merge}, staging_dir: {staging_dir}")
         self.video_url = download_info[0]
         self.download_format = download_info[1]
         self.resolution = download_info[2]
         self.video_title = download_info[3]
-        self.directory = None
+        self.directory = directory
         self.cookies_path = cookies_path
+        self.segment_transcode = segment_transcode
+        self.show_progress = show_progress
+        self.sidecars = sidecars
+        self.embed_sidecars = embed_sidecars
+        self.progress_callback = progress_callback
+        self.verify = verify
+        self.stream_merge = stream_merge
+        self.staging_dir = staging_dir
+        self._destination: str | None = None
+        self._digests: dict[str, tuple[str, int]] = {}
+        self.result: dict | None = None
 
-    def run(self):
-        """Selects and runs the appropriate download method based on format and resolution."""
+    def run(self) -> dict | None:
+        """Selects and runs the appropriate download method based on format and resolution.
+
+        Returns the job result (url, title, format, filepath) or None if nothing was downloaded.
+        """
         log.info(f"[downloader] DownloadYT.run() called for: {self.video_title}")
         if not self.video_title:
-            log.error("Video title is empty. Aborting.")
-            msgbox.showerror(title=ERROR_TITLE, message="Video title cannot be empty.")
-            sys.exit(1)
+            try:
+                raise ValueError("Video title cannot be empty.")
+            except ValueError as e:
+                log.error("Video title is empty. Aborting.")
+                gather_info(e, "error", "Video title cannot be empty.", __name__)
+            return None
 
         if self.download_format == "mp4":
             if self.resolution and self.resolution[-1:] == "p":
                 self._download('mp4', quality=''.join(filter(str.isdigit, self.resolution)), best=False)
             else:
                 self._download('mp4', best=True)
-        elif self.download_format == "mp3":
+        elif self.download_format in ("mp3", "m4a", "opus"):
             if self.resolution and self.resolution[-4:] == "kbps":
-                self._download('mp3', quality=''.join(filter(str.isdigit, self.resolution)), best=False)
+                self._download(self.download_format, quality=''.join(filter(str.isdigit, self.resolution)), best=False)
             else:
-                self._download('mp3', best=True)
+                self._download(self.download_format, best=True)
         else:
             try:
-                raise ValueError(f"Download format not in range of 'mp4' or 'mp3'. Format: {self.download_format}")
+                raise ValueError(f"Download format not in range of 'mp4', 'mp3', 'm4a' or 'opus'. Format: {self.download_format}")
             except ValueError as e:
                 log.error(f"An error occurred while determining what download format to select: {self.download_format}")
                 gather_info(e, "error", f"An error occurred while determining what download format to select: {self.download_format}", __name__)
+        return self.result
 
     def _show_progress_window(self):
         """Show a simple progress window during download."""
@@ -88,7 +121,10 @@ class DownloadYT:
             self._progress_root.update_idletasks()
 
     def _hook(self, d):
-        # yt_dlp progress hook
+        # yt_dlp progress hook; a progress_callback (e.g. the job dashboard) takes the raw dict instead of the window
+        if self.progress_callback:
+            self.progress_callback(d)
+            return
         if d['status'] == 'downloading':
             percent = 0
             if 'total_bytes' in d and d['total_bytes']:
@@ -104,6 +140,11 @@ class DownloadYT:
         elif d['status'] == 'finished':
             self._update_progress(100, "Download complete!")
 
+    def _pp_hook(self, d):
+        # yt_dlp post-processor hook; gives a progress_callback (e.g. a queue worker) a chance to abort between steps
+        if self.progress_callback:
+            self.progress_callback({'status': 'processing', 'postprocessor': d.get('postprocessor'), 'info_dict': d.get('info_dict') or {}})
+
     def _download(self, fmt: str, quality: str | None = None, best: bool = False):
         """Generalized download method for both mp3 and mp4, with or without quality."""
         log.info(f"[downloader] Starting download: format={fmt}, quality={quality}, best={best}")
@@ -114,6 +155,7 @@ class DownloadYT:
             'ignoreerrors': False,
             'logger': YTDlpLogger(),
             'progress_hooks': [self._hook],
+            'postprocessor_hooks': [self._pp_hook],
         }
         cookies_path = get_cookies_file_path()
         if cookies_path:
@@ -133,27 +175,75 @@ class DownloadYT:
                     'merge_output_format': 'mp4',
                 })
             cleanup_temp = True
-        elif fmt == 'mp3':
+        elif fmt in ('mp3', 'm4a', 'opus'):
+            base_opts.update(self._audio_opts(fmt, quality, best))
+            cleanup_temp = False
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        directory = self.directory or self._select_directory()
+        if not directory:
+            log.info("[downloader] No directory selected. Nothing will be downloaded.")
+            return
+        # With a staging directory, fragments, intermediates and merges stay on scratch space until the file is finished
+        self._destination = directory
+        work_dir = make_staging_dir(self.staging_dir) if self.staging_dir else None
+        ydl_opts = self._prepare_ydl_opts(base_opts, work_dir or directory)
+        try:
+            self._download_with_opts(ydl_opts, cleanup_temp=cleanup_temp)
+        except BaseException:
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        if work_dir:
+            if self.result:
+                try:
+                    with profile_phase('finalize', self.video_url):
+                        self._finalize_staged(directory)
+                except BaseException:
+                    # The staged files may be the only finished copy
+                    log.error(f"[downloader] Could not move the download to {directory}; the finished files are kept in {work_dir}")
+                    raise
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _audio_opts(self, fmt: str, quality: str | None = None, best: bool = False) -> dict:
+        """Build format selection and post-processing options for audio downloads.
+
+        A requested bitrate picks the source stream whose bitrate is closest to it,
+        and ExtractAudioPP caps the 'mp3' bitrate at that stream's bitrate, so
+        'mp3' never re-encodes to a higher bitrate than the source carries.
+        'm4a' and 'opus' are native modes: the matching stream is kept as-is and
+        only remuxed (stream copy), never re-encoded.
+        """
+        opts = {}
+        if not (best or not quality):
+            opts['format_sort'] = [f'abr~{quality}']
+        if fmt == 'mp3':
             postproc = {
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
             }
             if not (best or not quality):
                 postproc['preferredquality'] = quality
-            base_opts.update({
-                'format': 'bestaudio/best',
-                'postprocessors': [postproc],
-            })
-            cleanup_temp = False
+            opts['format'] = 'bestaudio/best'
+        elif fmt == 'm4a':
+            # 'best' keeps the source codec and only changes the container if needed
+            postproc = {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }
+            opts['format'] = 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best'
+        elif fmt == 'opus':
+            postproc = {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }
+            opts['format'] = 'bestaudio[acodec=opus]/bestaudio/best'
         else:
-            raise ValueError(f"Unsupported format: {fmt}")
-
-        directory = self._select_directory()
-        if not directory:
-            sys.exit(0)
-        ydl_opts = self._prepare_ydl_opts(base_opts, directory)
-        self._download_with_opts(ydl_opts, cleanup_temp=cleanup_temp)
-        sys.exit(0)
+            raise ValueError(f"Unsupported audio format: {fmt}")
+        opts['postprocessors'] = [postproc]
+        log.debug(f"[downloader] Audio options for {fmt}: {opts}")
+        return opts
 
     def _get_ffmpeg_path(self):
         """Return the path to the ffmpeg binary depending on the OS."""
@@ -217,31 +307,199 @@ class DownloadYT:
             self._progress_root.destroy()
             self._progress_root = None
 
-    def _cleanup_temp_files(self, output_path):
-        # Remove leftover temp files after download
+    def _cleanup_temp_files(self, output_path, keep: tuple[str, ...] = ()):
+        # Remove leftover temp files after download (files in keep, such as sidecars, are left alone)
         log.info(f"[downloader] Cleaning up temp files for: {output_path}")
         base, _ = os.path.splitext(output_path)
         directory = os.path.dirname(output_path)
+        keep_names = {os.path.basename(path) for path in keep}
         for ext in [".webm", ".m4a", ".f*", ".mp3", ".opus"]:
             for f in os.listdir(directory):
+                if f in keep_names:
+                    continue
                 if f.startswith(os.path.basename(base)) and f != os.path.basename(output_path) and f.endswith(tuple(ext.replace('*',''))):
                     try:
                         os.remove(os.path.join(directory, f))
                     except Exception:
                         pass
 
+    def _split_custom_postprocessors(self, ydl_opts: dict) -> tuple[dict, list[dict]]:
+        # Pull out post-processors that are replaced by our own subclasses (yt_dlp only builds its built-in ones from opts)
+        ydl_opts = ydl_opts.copy()
+        builtin, custom = [], []
+        for pp in ydl_opts.get('postprocessors', []):
+            (custom if pp.get('key') == 'FFmpegExtractAudio' else builtin).append(pp)
+        ydl_opts['postprocessors'] = builtin
+        return ydl_opts, custom
+
+    def _build_result(self, info: dict | None) -> dict:
+        # Summarize a finished download for callers such as the queue worker
+        downloads = (info or {}).get('requested_downloads') or [{}]
+        return {
+            'url': self.video_url,
+            'title': (info or {}).get('title') or self.video_title,
+            'format': self.download_format,
+            'filepath': downloads[-1].get('filepath') or (info or {}).get('filepath'),
+        }
+
+    def _run_ydl(self, ydl: yt_dlp.YoutubeDL, ydl_opts: dict):
+        # Download the media; sidecars are fetched from the same extraction while the media streams
+        info = ydl.extract_info(self.video_url, download=False)
+        existing = self._existing_download(ydl, info) # type: ignore
+        if existing:
+            # yt_dlp's own check looks in the staging directory and the streaming merge has none, so check here
+            log.info(f"[downloader] {existing} has already been downloaded; skipping.")
+            info['filepath'] = existing # type: ignore
+            info['requested_downloads'] = [{'filepath': existing}] # type: ignore
+            self.result = self._build_result(info) # type: ignore
+            self._check_integrity(info, ydl_opts) # type: ignore
+            return
+        sidecar_fetch = None
+        if self.sidecars:
+            base_path, _ = os.path.splitext(ydl.prepare_filename(info))
+            sidecar_fetch = SidecarFetch(ydl, info, base_path, self.sidecars) # type: ignore
+        try:
+            info = self._download_media(ydl, info, ydl_opts) # type: ignore
+        except BaseException:
+            # Do not leave sidecars of a download that did not happen in the destination
+            if sidecar_fetch is not None:
+                sidecar_fetch.discard()
+            raise
+        self.result = self._build_result(info)
+        if sidecar_fetch is not None:
+            self.result['sidecars'] = sidecar_fetch.results()
+            if self.embed_sidecars and self.result.get('filepath'):
+                self._update_progress(100, "Embedding thumbnail/subtitles...")
+                self._embed(self.result['filepath'], ydl_opts)
+        self._check_integrity(info, ydl_opts) # type: ignore
+
+    def _existing_download(self, ydl: yt_dlp.YoutubeDL, info: dict) -> str | None:
+        # Path of a finished file for info in the destination directory, in the downloaded or the converted format
+        if not self._destination or ydl.params.get('overwrites'):
+            return None
+        base = os.path.splitext(os.path.basename(ydl.prepare_filename(info)))[0]
+        for ext in dict.fromkeys((info.get('ext'), self.download_format)):
+            path = os.path.join(self._destination, f"{base}.{ext}")
+            if ext and os.path.isfile(path):
+                return path
+        return None
+
+    def _download_media(self, ydl: yt_dlp.YoutubeDL, info: dict, ydl_opts: dict) -> dict:
+        # With stream_merge, video and audio are muxed by one ffmpeg while they download; otherwise yt_dlp
+        # downloads both to intermediate files and merges them afterwards
+        if self.stream_merge and can_stream_merge(info):
+            filepath = ydl.prepare_filename(info)
+            try:
+                digest = stream_merge(info, filepath, ydl, ydl_opts.get('ffmpeg_location'), self._hook, hash_output=self.verify)
+                if digest:
+                    self._record_digest(filepath, *digest)
+                info['filepath'] = filepath
+                info['requested_downloads'] = [{'filepath': filepath}]
+                return info
+            except FFmpegError as e:
+                log.warning(f"[downloader] Streaming merge failed, falling back to download and merge: {e}")
+        elif self.stream_merge:
+            log.info("[downloader] Selected formats cannot be stream merged; using download and merge.")
+        return ydl.process_ie_result(info, download=True) # type: ignore
+
+    def _embed(self, path: str, ydl_opts: dict):
+        # Embedding rewrites the file, so its old digest is dropped; when verifying, embed_sidecars reports the new
+        # one if it could hash while writing, otherwise _check_integrity hashes the finished file
+        self._digests.pop(path, None)
+        embed_sidecars(path, self.result['sidecars'], ydl_opts.get('ffmpeg_location'), # type: ignore
+                       on_output=self._record_digest if self.verify else None)
+
+    def _finalize_staged(self, directory: str):
+        # Move the finished media and its sidecars from the staging directory to the destination
+        filepath = self.result.get('filepath') # type: ignore
+        sidecars = self.result.get('sidecars') or {} # type: ignore
+        # A file that had already been downloaded is in the destination already
+        media = [filepath] if filepath and not os.path.samefile(os.path.dirname(filepath), directory) else []
+        staged = media + [path for value in sidecars.values() for path in (value.values() if isinstance(value, dict) else [value])]
+        # Check every name before moving anything, so a clash never leaves the media moved and its sidecars behind
+        done = set()
+        for path in staged:
+            dst = os.path.join(directory, os.path.basename(path))
+            if not os.path.exists(dst):
+                continue
+            if path in media or not filecmp.cmp(path, dst, shallow=False):
+                raise FileExistsError(errno.EEXIST, "Destination file already exists", dst)
+            # The same sidecar is there already (e.g. from an earlier run of a job that was retried)
+            done.add(path)
+
+        def finalize(path: str) -> str:
+            if path in done:
+                os.remove(path)
+                return os.path.join(directory, os.path.basename(path))
+            return finalize_to_destination(path, directory)
+
+        if media:
+            self.result['filepath'] = finalize(filepath) # type: ignore
+        for kind, value in sidecars.items():
+            if isinstance(value, dict):
+                sidecars[kind] = {lang: finalize(path) for lang, path in value.items()}
+            else:
+                sidecars[kind] = finalize(value)
+
+    def _record_digest(self, path: str, sha256: str, size: int):
+        # Called by post-processors that hashed their output while writing it
+        log.debug(f"[downloader] In-stream digest for {path}: sha256={sha256}, {size} bytes")
+        self._digests[path] = (sha256, size)
+
+    def _forget_digest(self, path: str):
+        # A post-processor rewrote path after its digest was taken
+        self._digests.pop(path, None)
+
+    def _check_integrity(self, info: dict, ydl_opts: dict):
+        # Attach digest and size to the result; with verify, also compare the container against the probe
+        path = (self.result or {}).get('filepath')
+        if not path:
+            return
+        digest = self._digests.get(path)
+        if digest is None:
+            log.debug(f"[downloader] No in-stream digest for {path}; hashing the finished file.")
+            digest = hash_file(path)
+        self.result['sha256'], self.result['size'] = digest # type: ignore
+        if self.verify:
+            expected_streams = {'audio': 1} if info.get('acodec') != 'none' else {}
+            if self.download_format == 'mp4' and info.get('vcodec') not in (None, 'none'):
+                expected_streams['video'] = 1
+            verify_container(path, info.get('duration'), expected_streams, ffprobe_path_for(ydl_opts.get('ffmpeg_location')))
+            log.info(f"[downloader] Verified {path}: {expected_streams}, duration {info.get('duration')}s")
+
+    def _sidecar_paths(self) -> tuple[str, ...]:
+        # Flatten the sidecar paths of the current result
+        sidecars = (self.result or {}).get('sidecars') or {}
+        paths = []
+        for value in sidecars.values():
+            paths.extend(value.values() if isinstance(value, dict) else [value])
+        return tuple(paths)
+
+    @profiled('download', job=lambda self, *args, **kwargs: self.video_url)
     def _download_with_opts(self, ydl_opts: dict, cleanup_temp: bool = False):
         """Run yt_dlp with the given options to download the video/audio."""
         log.info("[downloader] Download process started.")
-        self._show_progress_window()
+        if self.show_progress:
+            self._show_progress_window()
+        ydl_opts, custom_pps = self._split_custom_postprocessors(ydl_opts)
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Outputs are hashed while written only when verifying: that needs pipe-friendly (fragmented) containers,
+            # so everyone else gets yt_dlp's normal seekable output and a hash of the finished file
+            if self.verify:
+                ydl = HashingYoutubeDL(ydl_opts, on_output=self._record_digest, on_rewrite=self._forget_digest)
+            else:
+                ydl = yt_dlp.YoutubeDL(ydl_opts)
+            with ydl:
+                for pp in custom_pps:
+                    ydl.add_post_processor(ExtractAudioPP(
+                        ydl, pp.get('preferredcodec'), pp.get('preferredquality'),
+                        segmented=self.segment_transcode, on_output=self._record_digest if self.verify else None,
+                    ), when='post_process')
                 try:
-                    ydl.download([self.video_url])
+                    self._run_ydl(ydl, ydl_opts)
                 except yt_dlp.utils.ExtractorError as e:
                     if 'cookies' in str(e).lower():
                         log.error(f"Cookies are required but not provided for {self.video_url}: {e}")
-                        msgbox.showerror(title=ERROR_TITLE, message="Cookies are required for this video but none were provided. Please provide cookies.txt if needed.")
                         gather_info(e, "error", "Cookies are required for this video but none were provided. Please provide cookies.txt if needed.", __file__)
                         return
                     else:
@@ -254,7 +512,9 @@ class DownloadYT:
                     template = outtmpl.get('default') or next(iter(outtmpl.values()))
                 else:
                     template = outtmpl
-                if template:
+                if self.result and self.result.get('filepath'):
+                    self._cleanup_temp_files(self.result['filepath'], keep=self._sidecar_paths())
+                elif template:
                     output_path = template.replace('%(ext)s', 'mp4')
                     self._cleanup_temp_files(output_path)
 
@@ -1,5 +1,6 @@
 from logging_setup import log
 from constants import WARNING_TITLE, ERROR_TITLE, INFO_TITLE, ISSUE_INFO_HTML
+from error_report import ErrorRecord, collecting, record_error
 
 import sys
 import traceback
@@ -97,12 +98,17 @@ def error_display(
         sys.exit()
 
 # Gather traceback info and display/log the error
+# While error_report.collect_errors() is active the error is only logged and recorded; no dialog, no exit
 def gather_info(
     e: Exception,
     e_type: str,
     context: str,
     file_name: str
-):
+) -> ErrorRecord | None:
+    if collecting():
+        log.error(f"Recorded {e_type} {type(e).__name__}: {e} ({context})")
+        return record_error(e, e_type, context, file_name)
+
     exc_type, exc_value, exc_traceback = sys.exc_info()
     frames = traceback.extract_tb(exc_traceback)
     try:
@@ -0,0 +1,156 @@
+# error_report.py collects handled errors as structured records so batch runs keep going and report them at the end.
+# It does not import the GUI toolkits, so queue workers can use it on headless hosts.
+
+import contextvars
+import json
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+# Records kept in memory; older ones are dropped so a worker that runs for weeks does not grow without bound
+MAX_RECORDS = 1000
+
+@dataclass(slots=True)
+class ErrorRecord:
+    """One handled error and the job it belongs to."""
+    job: str
+    e_type: str
+    exception: str
+    message: str
+    context: str
+    location: str
+    details: str
+    time: float
+
+class ErrorCollector:
+    """Thread-safe store of ErrorRecords, kept per job.
+
+    While enabled, error_handler.gather_info adds a record here instead of
+    showing a modal dialog and exiting, so one bad job does not stop the others.
+    A long-running worker would otherwise keep every traceback it ever saw, so
+    at most max_records are kept and the oldest jobs' records are dropped first.
+    """
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self._lock = threading.Lock()
+        # Records by job, in the order the jobs first reported an error
+        self._jobs: dict[str, list[ErrorRecord]] = {}
+        self._count = 0
+        self.max_records = max_records
+        self.dropped = 0
+        self.enabled = False
+
+    def add(self, record: ErrorRecord):
+        with self._lock:
+            self._jobs.setdefault(record.job, []).append(record)
+            self._count += 1
+            while self._count > self.max_records:
+                oldest = next(iter(self._jobs))
+                records = self._jobs[oldest]
+                records.pop(0)
+                if not records:
+                    del self._jobs[oldest]
+                self._count -= 1
+                self.dropped += 1
+
+    def records(self, job: str | None = None, e_type: str | None = None) -> list[ErrorRecord]:
+        """Return the records, optionally only those of one job and/or one e_type."""
+        with self._lock:
+            if job is not None:
+                candidates = self._jobs.get(job, [])
+            else:
+                candidates = [r for records in self._jobs.values() for r in records]
+            return [r for r in candidates if e_type is None or r.e_type == e_type]
+
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
+            self._count = 0
+            self.dropped = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def format_report(self) -> str:
+        """Plain text summary: one line per record, grouped by job."""
+        records = self.records()
+        if not records:
+            return "No errors."
+        jobs = len({r.job for r in records})
+        lines = [f"{len(records)} error(s) in {jobs} job(s):"]
+        if self.dropped:
+            lines.append(f"  ({self.dropped} older error(s) were dropped to stay within {self.max_records})")
+        for r in sorted(records, key=lambda r: (r.job, r.time)):
+            lines.append(f"  [{r.job or '-'}] {r.e_type}: {r.exception}: {r.message} ({r.context})")
+        return "\n".join(lines)
+
+    def write_json(self, path: str):
+        """Write all records, including tracebacks, to a JSON file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([asdict(r) for r in self.records()], f, indent=2)
+
+collector = ErrorCollector()
+
+# Job the current thread is working on; each thread starts with its own empty context
+_current_job: contextvars.ContextVar[str] = contextvars.ContextVar('current_job', default='')
+
+def collect_errors(enabled: bool = True):
+    """Collect errors as records instead of showing dialogs and exiting."""
+    collector.enabled = enabled
+
+def collecting() -> bool:
+    return collector.enabled
+
+def current_job() -> str:
+    return _current_job.get()
+
+@contextmanager
+def job_context(job: str):
+    """Attribute errors recorded inside the block to job."""
+    token = _current_job.set(job)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+def error_location(file_name: str) -> str | None:
+    """Describe where the exception currently being handled was raised, or None if there is none."""
+    frames = traceback.extract_tb(sys.exc_info()[2])
+    if not frames:
+        return None
+    last_frame = frames[-1]
+    return (
+        f"Line: {last_frame.lineno}\n"
+        f"File: {file_name}\n"
+        f"Function: {last_frame.name}"
+    )
+
+def record_error(e: Exception, e_type: str, context: str, file_name: str) -> ErrorRecord:
+    """Add a record for e to the collector and return it."""
+    location = error_location(file_name) or "No traceback available."
+    record = ErrorRecord(
+        job=current_job(),
+        e_type=e_type,
+        exception=type(e).__name__,
+        message=str(e),
+        context=context,
+        location=location,
+        details="".join(traceback.format_exception(type(e), e, e.__traceback__)),
+        time=time.time(),
+    )
+    collector.add(record)
+    return record
+
+if __name__ == "__main__":
+    # Example usage: two failing jobs keep running and are reported together at the end
+    collect_errors()
+    for job in ("1", "2"):
+        with job_context(job):
+            try:
+                1 / 0   # type: ignore
+            except Exception as e:
+                record_error(e, "error", "Testing error report", __file__)
+    print(collector.format_report())
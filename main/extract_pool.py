@@ -0,0 +1,86 @@
+# extract_pool.py runs yt-dlp probes in a warm process pool so CPU-heavy extraction is not serialized on the GIL.
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+import yt_dlp
+
+from video_record import VideoInfo, fetch_video_record, probe_opts
+
+# Per-process YoutubeDL, created once by the pool initializer and reused for every probe
+_worker_ydl: yt_dlp.YoutubeDL | None = None
+
+class ExtractionError(RuntimeError):
+    """A probe failed in a worker process (carries the original error type and message)."""
+
+def _init_worker(ydl_opts: dict):
+    # Runs once in every worker process; yt_dlp is already imported at module load
+    global _worker_ydl
+    _worker_ydl = yt_dlp.YoutubeDL(ydl_opts)
+
+def _warm() -> int:
+    return os.getpid()
+
+def _probe(url: str) -> VideoInfo:
+    # yt-dlp errors hold tracebacks that cannot be pickled, so only their type and message cross the process boundary
+    try:
+        return fetch_video_record(url, _worker_ydl)
+    except Exception as e:
+        raise ExtractionError(f"{type(e).__name__}: {e}") from None
+
+class ExtractionPool:
+    """Pool of warm extraction processes that return compact VideoInfo records."""
+    def __init__(self, workers: int | None = None, cookies_path: str | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        ydl_opts = probe_opts(cookies_path)
+        # The format table is only useful for interactive use
+        ydl_opts['listformats'] = False
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(ydl_opts,))
+
+    def warm(self):
+        """Start all worker processes now instead of on the first probes."""
+        for future in [self._executor.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, url: str) -> Future:
+        """Probe one URL; the future resolves to a VideoInfo or raises ExtractionError."""
+        return self._executor.submit(_probe, url)
+
+    def imap(self, urls: Iterable[str], window: int | None = None) -> Iterator[tuple[str, VideoInfo | ExtractionError]]:
+        """Probe URLs in order with at most window probes in flight, yielding (url, record or error)."""
+        window = window or self.workers * 2
+        pending: deque[tuple[str, Future]] = deque()
+        for url in urls:
+            pending.append((url, self.submit(url)))
+            if len(pending) >= window:
+                yield self._result(*pending.popleft())
+        while pending:
+            yield self._result(*pending.popleft())
+
+    @staticmethod
+    def _result(url: str, future: Future) -> tuple[str, VideoInfo | ExtractionError]:
+        try:
+            return url, future.result()
+        except ExtractionError as e:
+            return url, e
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> 'ExtractionPool':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+if __name__ == "__main__":
+    # Example usage: probe several URLs in parallel
+    import sys
+    urls = sys.argv[1:] or ["https://www.youtube.com/watch?v=hrnASwStFec", "https://www.youtube.com/watch?v=invalidvideoid"]
+    with ExtractionPool() as pool:
+        pool.warm()
+        for url, record in pool.imap(urls):
+            print(f"{url}: {record}")
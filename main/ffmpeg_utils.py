@@ -0,0 +1,60 @@
+# ffmpeg_utils.py holds small ffmpeg/ffprobe helpers shared by the post-processing modules.
+
+import json
+import os
+import subprocess
+
+class FFmpegError(RuntimeError):
+    """Raised when an ffmpeg or ffprobe invocation fails."""
+
+def ffprobe_path_for(ffmpeg_path: str | None) -> str:
+    """Return the ffprobe binary that sits next to the given ffmpeg binary (or 'ffprobe' from PATH)."""
+    if not ffmpeg_path:
+        return 'ffprobe'
+    directory, filename = os.path.split(ffmpeg_path)
+    candidate = os.path.join(directory, filename.replace('ffmpeg', 'ffprobe'))
+    if os.path.isfile(candidate):
+        return candidate
+    return 'ffprobe'
+
+def run_ffmpeg(args: list[str], ffmpeg_path: str | None = None) -> None:
+    """Run ffmpeg with the given arguments and raise FFmpegError on failure."""
+    cmd = [ffmpeg_path or 'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', *args]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise FFmpegError(lines[-1] if lines else f"ffmpeg exited with code {result.returncode}")
+
+def ffprobe_json(path: str, args: list[str], ffprobe_path: str | None = None) -> dict:
+    """Run ffprobe with JSON output on a file and return the parsed result."""
+    cmd = [ffprobe_path or 'ffprobe', '-v', 'error', '-of', 'json', *args, path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise FFmpegError(lines[-1] if lines else f"ffprobe exited with code {result.returncode}")
+    return json.loads(result.stdout or '{}')
+
+def probe_duration(path: str, ffprobe_path: str | None = None) -> float | None:
+    """Return the container duration in seconds, or None if unknown."""
+    data = ffprobe_json(path, ['-show_entries', 'format=duration'], ffprobe_path)
+    try:
+        return float(data['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def probe_audio_stream(path: str, ffprobe_path: str | None = None) -> dict:
+    """Return codec_name and sample_rate of the first audio stream."""
+    data = ffprobe_json(path, ['-select_streams', 'a:0', '-show_entries', 'stream=codec_name,sample_rate'], ffprobe_path)
+    streams = data.get('streams') or []
+    if not streams:
+        raise FFmpegError(f"No audio stream found in {path}")
+    return streams[0]
+
+def probe_first_packet_time(path: str, ffprobe_path: str | None = None) -> float:
+    """Return the presentation time of the first audio packet in seconds."""
+    data = ffprobe_json(path, ['-select_streams', 'a:0', '-read_intervals', '%+#1', '-show_entries', 'packet=pts_time'], ffprobe_path)
+    packets = data.get('packets') or []
+    try:
+        return float(packets[0]['pts_time'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0.0
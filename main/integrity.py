@@ -0,0 +1,195 @@
+# integrity.py computes SHA-256 digests while output is written and sanity-checks finished files.
+
+import hashlib
+import os
+import subprocess
+from typing import Callable
+
+import yt_dlp
+from yt_dlp.postprocessor import FFmpegMergerPP
+from yt_dlp.postprocessor.ffmpeg import FFmpegFixupPostProcessor
+from yt_dlp.utils import PostProcessingError
+
+from ffmpeg_utils import FFmpegError, ffprobe_json
+
+CHUNK_SIZE = 1024 * 1024
+
+# Output options for containers that can be written to a pipe without seeking back; only these are hashed in-stream,
+# and only when a caller asks for it (verification). MP4 is then written fragmented (index up front, media in fragments)
+# because a plain MP4 seeks back to write its index. MP3 is left out: piped, it loses the Xing/LAME header that VBR
+# duration and gapless playback depend on.
+PIPE_MUXERS = {
+    '.opus': ['-f', 'opus'],
+    '.ogg': ['-f', 'ogg'],
+    '.mp4': ['-f', 'mp4', '-movflags', '+frag_keyframe+empty_moov+default_base_moof'],
+}
+PROGRESS_INTERVAL = 0.5
+
+class IntegrityError(RuntimeError):
+    """Raised when a finished file does not match what the probe promised."""
+
+class HashingWriter:
+    """File wrapper that feeds every written chunk into a SHA-256 digest."""
+    def __init__(self, f):
+        self._f = f
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+def write_ffmpeg_output(args: list[str], dst: str, ffmpeg_path: str | None = None,
+                        on_progress: Callable[[int], None] | None = None,
+                        hash_output: bool = False) -> tuple[str, int] | None:
+    """Run ffmpeg with args (inputs and codec options) and write its output to dst.
+
+    With hash_output, containers in PIPE_MUXERS go through a pipe and are hashed
+    as they are written, and (sha256, size) is returned. Otherwise ffmpeg writes
+    dst itself (seekable, so headers are finalized as usual) and None is
+    returned. on_progress(bytes_written) is called while ffmpeg runs.
+    """
+    muxer = PIPE_MUXERS.get(os.path.splitext(dst)[1].lower()) if hash_output else None
+    base_cmd = [ffmpeg_path or 'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', *args]
+    if muxer is None:
+        proc = subprocess.Popen([*base_cmd, dst], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    _, stderr_bytes = proc.communicate(timeout=PROGRESS_INTERVAL if on_progress else None)
+                    break
+                except subprocess.TimeoutExpired:
+                    on_progress(os.path.getsize(dst) if os.path.exists(dst) else 0) # type: ignore
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if proc.returncode != 0:
+            lines = stderr_bytes.decode(errors='replace').strip().splitlines()
+            raise FFmpegError(lines[-1] if lines else f"ffmpeg exited with code {proc.returncode}")
+        return None
+
+    proc = subprocess.Popen([*base_cmd, *muxer, 'pipe:1'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    try:
+        with open(dst, 'wb') as f:
+            writer = HashingWriter(f)
+            while chunk := proc.stdout.read(CHUNK_SIZE): # type: ignore
+                writer.write(chunk)
+                if on_progress:
+                    on_progress(writer.size)
+        stderr = proc.stderr.read().decode(errors='replace') # type: ignore
+    except BaseException:
+        # ffmpeg would block on the full pipe forever once we stop reading
+        proc.kill()
+        raise
+    finally:
+        returncode = proc.wait()
+    if returncode != 0:
+        lines = stderr.strip().splitlines()
+        raise FFmpegError(lines[-1] if lines else f"ffmpeg exited with code {returncode}")
+    return writer.hexdigest(), writer.size
+
+def postprocessor_args(pp, input_paths: list[str], opts: list[str]) -> list[str]:
+    """Inputs and output options of an ffmpeg post-processor run, with the user's --postprocessor-args.
+
+    Mirrors yt_dlp's FFmpegPostProcessor.real_run_ffmpeg for callers that run
+    ffmpeg themselves; the output path is left to the caller.
+    """
+    args = []
+    for n, path in enumerate(input_paths, 1):
+        args += [*pp._configuration_args(pp.basename, [f'_i{n}', '_i']), '-i', path]
+    return [*args, *opts, *pp._configuration_args(pp.basename, ['_o1', '_o', ''])]
+
+class HashingMergerPP(FFmpegMergerPP):
+    """FFmpegMerger that writes the merged file through HashingWriter and reports on_output(path, sha256, size).
+
+    The merged MP4 is fragmented and has no faststart index, so this is only used when verifying.
+    """
+    def __init__(self, downloader=None, on_output: Callable[[str, str, int], None] | None = None):
+        super().__init__(downloader)
+        self._on_output = on_output
+        self._digest = None
+
+    @classmethod
+    def pp_key(cls):
+        # Keep yt_dlp's 'Merger' name so --postprocessor-args and hooks address this as the merger
+        return FFmpegMergerPP.pp_key()
+
+    def run(self, info):
+        self._digest = None
+        files_to_delete, info = super().run(info)
+        # The temp output was renamed to info['filepath']; renaming keeps the digest valid
+        if self._digest and self._on_output:
+            self._on_output(info['filepath'], *self._digest)
+        return files_to_delete, info
+
+    def run_ffmpeg_multiple_files(self, input_paths, out_path, opts, **kwargs):
+        if os.path.splitext(out_path)[1].lower() not in PIPE_MUXERS:
+            return super().run_ffmpeg_multiple_files(input_paths, out_path, opts, **kwargs)
+        try:
+            self._digest = write_ffmpeg_output(postprocessor_args(self, input_paths, opts), out_path, self.executable, hash_output=True)
+        except FFmpegError as e:
+            raise PostProcessingError(f'merging formats failed: {e}')
+
+class HashingYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL whose format merge hashes its output while writing it; used when downloads are verified.
+
+    yt_dlp creates its FFmpegMerger itself, so it is swapped for HashingMergerPP
+    when it runs. Fixups that rewrite the merged file afterwards are reported
+    through on_rewrite(path), since they make the digest stale.
+    """
+    def __init__(self, params: dict | None = None, on_output: Callable[[str, str, int], None] | None = None,
+                 on_rewrite: Callable[[str], None] | None = None, **kwargs):
+        super().__init__(params, **kwargs)
+        self._on_output = on_output
+        self._on_rewrite = on_rewrite
+
+    def run_pp(self, pp, infodict):
+        if type(pp) is FFmpegMergerPP:
+            pp = HashingMergerPP(self, on_output=self._on_output)
+        infodict = super().run_pp(pp, infodict)
+        if isinstance(pp, FFmpegFixupPostProcessor) and self._on_rewrite and infodict.get('filepath'):
+            self._on_rewrite(infodict['filepath'])
+        return infodict
+
+def hash_file(path: str) -> tuple[str, int]:
+    """Hash an existing file; used when no digest was taken while it was written."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+def verify_container(path: str, expected_duration: float | None, expected_streams: dict[str, int], ffprobe_path: str | None = None, tolerance: float = 2.0):
+    """Check duration and stream counts of a finished file against the probe; raise IntegrityError on mismatch.
+
+    expected_streams maps codec_type ('video', 'audio') to the minimum number of streams.
+    Attached pictures (cover art) do not count as video streams.
+    """
+    data = ffprobe_json(path, ['-show_entries', 'format=duration:stream=codec_type:stream_disposition=attached_pic'], ffprobe_path)
+    problems = []
+    counts: dict[str, int] = {}
+    for stream in data.get('streams') or []:
+        if (stream.get('disposition') or {}).get('attached_pic'):
+            continue
+        counts[stream.get('codec_type')] = counts.get(stream.get('codec_type'), 0) + 1 # type: ignore
+    for codec_type, minimum in expected_streams.items():
+        if counts.get(codec_type, 0) < minimum:
+            problems.append(f"expected {minimum} {codec_type} stream(s), found {counts.get(codec_type, 0)}")
+    try:
+        duration = float(data['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        duration = None
+    if expected_duration:
+        if duration is None:
+            problems.append("duration could not be read")
+        elif abs(duration - expected_duration) > max(tolerance, expected_duration * 0.01):
+            problems.append(f"duration {duration:.1f}s does not match expected {expected_duration:.1f}s")
+    if problems:
+        raise IntegrityError(f"{os.path.basename(path)}: " + "; ".join(problems))
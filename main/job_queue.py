@@ -0,0 +1,255 @@
+# job_queue.py is a leased job queue that lets several worker hosts share one download backlog.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+from logging_setup import log
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+@dataclass(slots=True)
+class Job:
+    """One queued job as seen by a worker."""
+    id: int
+    payload: dict
+    status: str = PENDING
+    attempts: int = 0
+    worker_id: str | None = None
+    lease_expires: float | None = None
+    result: dict | None = None
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+
+class JobQueueBackend:
+    """Interface of a queue backend.
+
+    A worker leases a job for a limited time and must heartbeat to keep it.
+    A lease that runs out is handed to the next worker that asks for work.
+    """
+    def enqueue(self, payload: dict) -> int:
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Job | None:
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        raise NotImplementedError
+
+    def complete(self, job_id: int, worker_id: str, result: dict) -> bool:
+        raise NotImplementedError
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = False) -> bool:
+        """Give up a leased job; with retry it goes back to pending unless it used up its attempts."""
+        raise NotImplementedError
+
+    def get(self, job_id: int) -> Job | None:
+        raise NotImplementedError
+
+    def counts(self) -> dict[str, int]:
+        raise NotImplementedError
+
+class SQLiteDatabase:
+    """One SQLite file opened with a connection per thread, shared by the SQLite-backed stores of this package.
+
+    Connections use the rollback journal (WAL only works when all processes are
+    on one host) and wait up to 30 seconds for a competing writer.
+    """
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def transaction(self) -> '_Transaction':
+        """Context manager running its block in BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error)."""
+        return _Transaction(self.connection())
+
+class SQLiteJobQueue(JobQueueBackend):
+    """Queue backend stored in a single SQLite file.
+
+    Works for several processes on one host and for hosts sharing the file on a
+    network filesystem with working POSIX/SMB byte-range locks (NFS with lockd,
+    SMB). It uses SQLite's rollback journal rather than WAL, because WAL needs
+    shared memory and therefore every process on the same host. Register another
+    backend for shares without reliable locking.
+    """
+    def __init__(self, path: str, max_attempts: int = 3):
+        self._db = SQLiteDatabase(path)
+        self.path = self._db.path
+        self.max_attempts = max_attempts
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " worker_id TEXT,"
+                " lease_expires REAL,"
+                " result TEXT,"
+                " error TEXT,"
+                " created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires)")
+
+    def _transaction(self) -> '_Transaction':
+        return self._db.transaction()
+
+    def enqueue(self, payload: dict) -> int:
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (payload, status, created) VALUES (?, ?, ?)",
+                (json.dumps(payload), PENDING, time.time()),
+            )
+            job_id = cur.lastrowid
+        log.debug(f"[job_queue] Enqueued job {job_id}: {payload}")
+        return job_id # type: ignore
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Job | None:
+        now = time.time()
+        with self._transaction() as conn:
+            # Jobs whose lease expired too often are given up instead of being handed out forever
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Lease expired too many times.', worker_id = NULL, lease_expires = NULL"
+                " WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (LEASED, worker_id, now + lease_seconds, row[0]),
+            )
+            job = self._get(conn, row[0])
+        log.info(f"[job_queue] Worker {worker_id} leased job {job.id} (attempt {job.attempts})") # type: ignore
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (time.time() + lease_seconds, job_id, worker_id, LEASED),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: dict) -> bool:
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL WHERE id = ? AND worker_id = ? AND status = ?",
+                (DONE, json.dumps(result), job_id, worker_id, LEASED),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = False) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            status = PENDING if retry and row and row[0] < self.max_attempts else FAILED
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker_id = NULL, lease_expires = NULL WHERE id = ? AND worker_id = ? AND status = ?",
+                (status, error, job_id, worker_id, LEASED),
+            )
+        return cur.rowcount == 1
+
+    def get(self, job_id: int) -> Job | None:
+        # Single-statement reads run in SQLite's own deferred transaction and never wait for the write lock
+        return self._get(self._db.connection(), job_id)
+
+    def counts(self) -> dict[str, int]:
+        rows = self._db.connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def _get(self, conn: sqlite3.Connection, job_id: int) -> Job | None:
+        row = conn.execute(
+            "SELECT id, payload, status, attempts, worker_id, lease_expires, result, error, created FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row[0],
+            payload=json.loads(row[1]),
+            status=row[2],
+            attempts=row[3],
+            worker_id=row[4],
+            lease_expires=row[5],
+            result=json.loads(row[6]) if row[6] else None,
+            error=row[7],
+            created=row[8],
+        )
+
+class _Transaction:
+    # Runs a block inside BEGIN IMMEDIATE ... COMMIT so competing workers never lease the same job
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+# Registered backends by URL scheme; 'sqlite' is the default for plain paths
+BACKENDS: dict[str, type[JobQueueBackend]] = {
+    'sqlite': SQLiteJobQueue,
+}
+
+def register_backend(scheme: str, backend: type[JobQueueBackend]):
+    """Register a queue backend class for URLs of the form '<scheme>://<location>'."""
+    BACKENDS[scheme] = backend
+
+def open_queue(location: str) -> JobQueueBackend:
+    """Open a queue from a path (SQLite) or a '<scheme>://<location>' URL."""
+    scheme, sep, rest = location.partition('://')
+    if not sep:
+        scheme, rest = 'sqlite', location
+    try:
+        backend = BACKENDS[scheme]
+    except KeyError:
+        raise ValueError(f"Unknown job queue backend: {scheme}")
+    return backend(rest)
+
+def _example_worker(path: str, worker_id: str):
+    # Worker process for the example below
+    queue = SQLiteJobQueue(path)
+    while (job := queue.lease(worker_id, lease_seconds=5)) is not None:
+        time.sleep(0.05)
+        queue.complete(job.id, worker_id, {'worker': worker_id, 'echo': job.payload})
+
+if __name__ == "__main__":
+    # Example usage: three local worker processes share one queue
+    import multiprocessing
+    import tempfile
+
+    queue_path = os.path.join(tempfile.mkdtemp(), 'jobs.db')
+    queue = SQLiteJobQueue(queue_path)
+    for i in range(30):
+        queue.enqueue({'url': f"https://www.youtube.com/watch?v=example{i}"})
+    workers = [multiprocessing.Process(target=_example_worker, args=(queue_path, f"worker-{n}")) for n in range(3)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    print(queue.counts())
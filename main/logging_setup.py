@@ -6,13 +6,15 @@ Configures the main logger for the YouTube Downloader application using the akeo
 - Uses LogConfig to create a logger named 'main'.
 - Logging is activated, printed to console, and saved to 'yt_downloader_logs.log' in the current directory.
 - Log level is set to DEBUG, with detailed formatting including line number, filename, and function name.
-- Log file is overwritten on each run (mode 'w').
+- Log file is overwritten on each run (mode 'w'). Child processes (such as the extraction pool's
+  workers, which re-import the main module when spawned) append instead, so they do not truncate it.
 
 See akeoott_logging_config.LogConfig and its setup() method for more details.
 """
 
 from akeoott_logging_config import LogConfig
 import logging
+import multiprocessing
 
 def setup_main_logger():
     log_main = LogConfig(logger_name="main")
@@ -25,7 +27,7 @@ def setup_main_logger():
         log_level=logging.DEBUG,
         log_format='%(levelname)s (%(asctime)s.%(msecs)03d)     %(message)s [Line: %(lineno)d in %(filename)s - %(funcName)s]',
         date_format='%Y-%m-%d %H:%M:%S',
-        log_file_mode='w'
+        log_file_mode='w' if multiprocessing.current_process().name == 'MainProcess' else 'a'
     )
     return log_main.logger
 
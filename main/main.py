@@ -4,10 +4,17 @@ YouTube Downloader Application
 This program provides a graphical interface for downloading YouTube videos or audio in various formats and qualities. It is designed to be user-friendly and cross-platform, supporting both Windows and Linux. The application uses yt-dlp for downloading and extracting video/audio streams, and provides support for cookies to allow downloads of age-restricted or private videos.
 
 Features:
-- GUI for entering YouTube URLs, selecting format (mp3/mp4), and choosing quality/resolution.
+- GUI for entering YouTube URLs, selecting format (mp3/m4a/opus/mp4), and choosing quality/resolution.
+- Audio downloads pick the source stream closest to the requested bitrate; m4a/opus are kept without re-encoding.
 - Fetches available audio qualities and video resolutions for the provided URL.
 - Handles cookies for authenticated downloads (place 'www.youtube.com_cookies.txt' in the program directory).
 - Progress window with real-time download status.
+- Optional segment-parallel transcoding of long audio (set YTDL_SEGMENT_TRANSCODE=1).
+- Optional thumbnail/subtitle/info JSON sidecars fetched alongside the media (YTDL_SIDECARS=thumbnail,subtitles,infojson; YTDL_EMBED_SIDECARS=1 to embed).
+- Opt-in profiling of probe, download and post-processing (set YTDL_PROFILE_DIR to an output directory).
+- SHA-256 and size of every finished file; with YTDL_VERIFY=1 merged and opus/ogg outputs are hashed while written and the container is checked after download.
+- Optional streaming merge of mp4 video and audio while they download, without intermediate files (YTDL_STREAM_MERGE=1).
+- Optional staging directory on fast local disk for in-flight work; finished files are moved to the chosen directory (YTDL_STAGING_DIR).
 - Error handling and logging for troubleshooting.
 - Supports both standalone and packaged (PyInstaller) execution.
 
@@ -15,9 +22,13 @@ Modules:
 - user_input.py: Handles all user input and GUI interactions.
 - downloader.py: Manages the download process using yt-dlp.
 - yt_info_fetch.py: Fetches available formats and metadata for a given YouTube URL.
+- video_record.py / extract_pool.py: Compact probe records and a process pool that runs probes past the GIL.
 - error_handler.py: Centralized error logging and reporting.
+- error_report.py: Per-job error records, collected instead of dialogs in batch runs and reported at the end.
 - logging_setup.py: Configures logging for the application.
 - constants.py: Stores constants such as program version and error titles.
+- job_queue.py / queue_worker.py: Shared job queue and headless worker for batch downloads on several hosts.
+- channel_sync.py: Queues only the new uploads of channels/playlists using a stored per-source watermark.
 
 To use:
 1. Run this script (main.py) to launch the GUI.
@@ -30,6 +41,7 @@ from constants import PROGRAM_VERSION
 from logging_setup import log
 from error_handler import gather_info
 
+import multiprocessing
 import sys
 import os
 import tkinter as tk
@@ -38,6 +50,8 @@ from tkinter import messagebox
 try:
     from user_input import YouTubeDownloaderGUI
     from downloader import DownloadYT
+    from sidecars import parse_sidecar_kinds
+    from staging import STAGING_DIR_ENV
 
 except ImportError as e:
     log.error(f"Failed to import necessary modules: {e}")
@@ -115,7 +129,14 @@ def main():
 
         download_info: list[str] = [video_url, download_format , resolution, video_title]
 
-        DownloadYT(download_info).run()
+        segment_transcode = os.environ.get("YTDL_SEGMENT_TRANSCODE") == "1"
+        sidecars = parse_sidecar_kinds(os.environ.get("YTDL_SIDECARS"))
+        embed = os.environ.get("YTDL_EMBED_SIDECARS") == "1"
+        verify = os.environ.get("YTDL_VERIFY") == "1"
+        merge = os.environ.get("YTDL_STREAM_MERGE") == "1"
+        staging_dir = os.environ.get(STAGING_DIR_ENV) or None
+        DownloadYT(download_info, segment_transcode=segment_transcode, sidecars=sidecars, embed_sidecars=embed, verify=verify,
+                   stream_merge=merge, staging_dir=staging_dir).run()
 
     else:
         log.info("GUI was closed or inputs were not finalized by the user. Exiting.")
@@ -124,6 +145,8 @@ def main():
     log.info("Application finished.")
 
 if __name__ == "__main__":
+    # Worker processes of a frozen (PyInstaller) Windows build re-run this script; this hands them to multiprocessing
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
@@ -0,0 +1,176 @@
+# profiling.py holds opt-in cProfile/tracemalloc/stack-sampling hooks for the probe, download and post-processing paths.
+
+import cProfile
+import functools
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable
+
+from logging_setup import log
+
+PROFILE_DIR_ENV = "YTDL_PROFILE_DIR"
+SAMPLE_INTERVAL = 0.005
+
+_profile_dir: str | None = os.environ.get(PROFILE_DIR_ENV) or None
+_local = threading.local()
+_sequence = itertools.count(1)
+
+# From Python 3.12 cProfile hooks into the process-wide sys.monitoring, so only one thread may run one at a time
+_cprofile_lock = threading.Lock()
+
+# tracemalloc keeps one process-wide peak; every reset folds it into the phases that are still running first.
+# Phase number -> (highest peak seen before a reset, numbers of the other phases that ran alongside it)
+_peak_lock = threading.Lock()
+_active_phases: dict[int, tuple[int, set[int]]] = {}
+# True while tracemalloc runs because of profile_phase, which stops it again when the last phase ends
+_started_tracing = False
+
+def _start_peak(number: int) -> int:
+    # Returns the traced memory when the phase starts
+    global _started_tracing
+    with _peak_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        for other, (other_peak, overlapping) in _active_phases.items():
+            _active_phases[other] = (max(other_peak, peak), overlapping | {number})
+        tracemalloc.reset_peak()
+        _active_phases[number] = (0, set(_active_phases))
+        return current
+
+def _end_peak(number: int) -> tuple[int, int, int]:
+    # Returns the traced memory at the end, the process-wide peak while the phase ran and how many other phases ran during it
+    global _started_tracing
+    with _peak_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        earlier_peak, overlapping = _active_phases.pop(number)
+        if not _active_phases and _started_tracing:
+            # Tracing slows every allocation and keeps a trace per block; nobody else asked for it
+            tracemalloc.stop()
+            _started_tracing = False
+        return current, max(earlier_peak, peak), len(overlapping)
+
+def enable_profiling(directory: str | None):
+    """Write profiles to directory (None disables). Same as setting YTDL_PROFILE_DIR."""
+    global _profile_dir
+    _profile_dir = directory or None
+    if _profile_dir:
+        os.makedirs(_profile_dir, exist_ok=True)
+        log.info(f"[profiling] Profiling enabled, writing to {_profile_dir}")
+
+def profiling_enabled() -> bool:
+    return _profile_dir is not None
+
+def _safe_name(label: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', label).strip('_')[-80:] or 'job'
+
+class _StackSampler(threading.Thread):
+    # Samples the target thread's Python stack at a fixed interval for collapsed-stack (flamegraph) output
+    def __init__(self, thread_id: int):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.thread_id = thread_id
+        self.stacks: Counter[str] = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+@contextmanager
+def profile_phase(phase: str, job: str = ""):
+    """Profile the enclosed block as one phase of a job if profiling is enabled.
+
+    Writes <job>-<phase>-<time>.pstats (cProfile), .collapsed (sampled stacks,
+    for flamegraph.pl/speedscope) and .mem.txt (traced memory at the start and
+    end of the phase and its peak). tracemalloc runs only while a phase does.
+    A nested phase pauses the enclosing phase's cProfile while it runs. Only one
+    thread runs cProfile at a time; a phase that starts while another thread is
+    profiling gets stacks and memory but no .pstats. tracemalloc only tracks the
+    whole process, so the peak in .mem.txt includes phases running at the same time.
+    """
+    if _profile_dir is None:
+        yield
+        return
+
+    directory = _profile_dir
+    number = next(_sequence)
+    outer = getattr(_local, 'profile', None)
+    if outer is not None:
+        outer.disable()
+    # The thread that owns the cProfile lock keeps it for its nested phases
+    owns_lock = getattr(_local, 'owns_cprofile', False)
+    acquired = not owns_lock and _cprofile_lock.acquire(blocking=False)
+    profile = cProfile.Profile() if owns_lock or acquired else None
+    if acquired:
+        _local.owns_cprofile = True
+    mem_start = _start_peak(number)
+    sampler = _StackSampler(threading.get_ident())
+    _local.profile = profile
+    started = time.perf_counter()
+    sampler.start()
+    if profile is not None:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        _local.profile = outer
+        if acquired:
+            _local.owns_cprofile = False
+            _cprofile_lock.release()
+        mem_end, peak, overlapping = _end_peak(number)
+        if outer is not None:
+            outer.enable()
+
+        base = os.path.join(directory, f"{_safe_name(job)}-{phase}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{number}")
+        try:
+            if profile is not None:
+                profile.dump_stats(f"{base}.pstats")
+            with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(f"{base}.mem.txt", 'w', encoding='utf-8') as f:
+                f.write(f"phase: {phase}\njob: {job}\nelapsed: {elapsed:.3f}s\n")
+                f.write(f"traced memory: {mem_start / 1024 / 1024:.2f} MiB at start, {mem_end / 1024 / 1024:.2f} MiB at end "
+                        f"({(mem_end - mem_start) / 1024 / 1024:+.2f} MiB)\n")
+                f.write(f"peak traced memory: {peak / 1024 / 1024:.2f} MiB (whole process while this phase ran; "
+                        f"{overlapping} other phase(s) ran during it and are included)\n")
+                if profile is None:
+                    f.write("cProfile: skipped, another thread was profiling (no .pstats)\n")
+            log.info(f"[profiling] {phase} for {job or 'job'} took {elapsed:.3f}s; profile written to {base}.*")
+        except OSError as e:
+            log.warning(f"[profiling] Could not write profile {base}: {e}")
+
+def profiled(phase: str, job: Callable[..., str] | None = None):
+    """Decorator form of profile_phase; job(*args, **kwargs) names the job from the call arguments."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile_dir is None:
+                return func(*args, **kwargs)
+            with profile_phase(phase, str(job(*args, **kwargs)) if job else ""):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
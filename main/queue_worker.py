@@ -0,0 +1,353 @@
+# queue_worker.py pulls download jobs from a shared job queue and reports the results back.
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+from typing import Callable, Iterable, Iterator
+
+from logging_setup import log
+from job_queue import Job, JobQueueBackend, open_queue
+from sidecars import parse_sidecar_kinds
+from profiling import enable_profiling
+from error_report import collector, collect_errors, job_context, record_error
+from staging import STAGING_DIR_ENV
+
+class LeaseLostError(RuntimeError):
+    """Raised from the progress hook to abort a job whose lease was taken over by another worker."""
+
+def get_cookies_file_path():
+    """Return path to cookies file if it exists, else None (the same file DownloadYT uses)."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    cookie_path = os.path.join(base_dir, 'www.youtube.com_cookies.txt')
+    if os.path.isfile(cookie_path):
+        log.debug("queue_worker: Cookies file will be used.")
+        return cookie_path
+    log.debug("queue_worker: No cookies file found.")
+    return None
+
+def is_transient(e: BaseException) -> bool:
+    """True if e (or the error behind it) is a network failure that another attempt may get past."""
+    from yt_dlp.networking.exceptions import HTTPError, TransportError
+    seen = set()
+    current: BaseException | None = e
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, HTTPError):
+            return current.status == 429 or current.status >= 500
+        if isinstance(current, (TransportError, ConnectionError, TimeoutError)):
+            return True
+        # yt_dlp's DownloadError keeps the error it wraps in exc_info
+        exc_info = getattr(current, 'exc_info', None)
+        current = exc_info[1] if exc_info else current.__cause__ or current.__context__
+    return False
+
+def default_worker_id() -> str:
+    """Return a worker id that is unique per host and process."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class QueueWorker:
+    """Leases jobs from a queue, runs them with a handler and keeps the lease alive while they run."""
+    def __init__(
+        self,
+        queue: JobQueueBackend,
+        handler: Callable[[dict, Callable[[dict], None] | None], dict | None],
+        worker_id: str | None = None,
+        lease_seconds: float = 120.0,
+        poll_interval: float = 5.0,
+        state=None,
+    ):
+        # state is an optional dashboard.JobStateStore that receives job phases and progress hooks
+        self.queue = queue
+        self.state = state
+        self.handler = handler
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = lease_seconds / 3
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Ask the worker to stop after the current job."""
+        self._stop.set()
+
+    def run(self, exit_when_empty: bool = False, max_jobs: int | None = None) -> int:
+        """Process jobs until stopped, the queue is empty (if exit_when_empty) or max_jobs ran. Returns jobs processed."""
+        log.info(f"[queue_worker] Worker {self.worker_id} started.")
+        processed = 0
+        while not self._stop.is_set() and (max_jobs is None or processed < max_jobs):
+            job = self.queue.lease(self.worker_id, self.lease_seconds)
+            if job is None:
+                if exit_when_empty:
+                    break
+                self._stop.wait(self.poll_interval)
+                continue
+            self._process(job)
+            processed += 1
+        log.info(f"[queue_worker] Worker {self.worker_id} stopped after {processed} jobs.")
+        return processed
+
+    def _heartbeat(self, job: Job, done: threading.Event, lost: threading.Event):
+        # Extend the lease until the job finishes; a lost lease means another worker may now own it
+        while not done.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job.id, self.worker_id, self.lease_seconds):
+                log.warning(f"[queue_worker] Lost lease on job {job.id}; aborting it.")
+                lost.set()
+                return
+
+    def _process(self, job: Job):
+        # Run one job with a heartbeat thread and report the outcome to the queue
+        done, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done, lost), daemon=True)
+        heartbeat.start()
+        if self.state is not None:
+            self.state.start(job.id, job.payload.get('title') or job.payload.get('url', ''))
+
+        def progress(d: dict):
+            # Raising here aborts the download (yt_dlp propagates hook errors), so a job that another
+            # worker has taken over stops writing to the shared destination
+            if lost.is_set():
+                raise LeaseLostError(f"Lease on job {job.id} was lost")
+            if self.state is not None:
+                self.state.update_from_hook(job.id, d)
+
+        retry = False
+        with job_context(str(job.id)):
+            try:
+                result = self.handler(job.payload, progress) or {}
+                # Errors the handler reported through error_handler.gather_info instead of raising
+                errors = collector.records(job=str(job.id), e_type="error")
+                error = f"{errors[-1].exception}: {errors[-1].message}" if errors else None
+            except LeaseLostError as e:
+                log.warning(f"[queue_worker] {e}; job aborted, its output is left to the new owner.")
+                done.set()
+                heartbeat.join()
+                if self.state is not None:
+                    self.state.set_phase(job.id, "lost lease")
+                return
+            except Exception as e:
+                log.exception(f"[queue_worker] Job {job.id} failed: {e}")
+                record_error(e, "error", f"Job {job.id} failed", __file__)
+                error = f"{type(e).__name__}: {e}"
+                retry = is_transient(e)
+        done.set()
+        heartbeat.join()
+        if error is not None:
+            if retry:
+                log.warning(f"[queue_worker] Job {job.id} hit a network error ({error}); it goes back to the queue unless it used up its attempts.")
+            else:
+                log.warning(f"[queue_worker] Marking job {job.id} failed: {error}")
+            self.queue.fail(job.id, self.worker_id, error, retry=retry)
+            if self.state is not None:
+                self.state.set_phase(job.id, "retrying" if retry else "failed", error)
+            return
+        if lost.is_set() or not self.queue.complete(job.id, self.worker_id, result):
+            log.warning(f"[queue_worker] Could not report job {job.id}; the lease was taken over by another worker.")
+            if self.state is not None:
+                self.state.set_phase(job.id, "lost lease")
+        else:
+            log.info(f"[queue_worker] Job {job.id} done: {result}")
+            if self.state is not None:
+                self.state.set_phase(job.id, "done")
+
+def download_handler(directory: str, segment_transcode: bool = False, sidecars: tuple[str, ...] = (),
+                     embed_sidecars: bool = False, verify: bool = False, stream_merge: bool = False,
+                     staging_dir: str | None = None) -> Callable[[dict, Callable[[dict], None] | None], dict | None]:
+    """Return a handler that downloads a job payload {'url', 'format', 'quality', 'title'} into directory."""
+    # Imported here so 'enqueue' and 'status' work on hosts without the GUI toolkits
+    from downloader import DownloadYT
+
+    def handle(payload: dict, progress: Callable[[dict], None] | None = None) -> dict | None:
+        download_info = [
+            payload['url'],
+            payload.get('format', 'mp4'),
+            payload.get('quality', ''),
+            payload.get('title') or '%(title)s',
+        ]
+        return DownloadYT(download_info, segment_transcode=segment_transcode, directory=directory, show_progress=False,
+                          sidecars=sidecars, embed_sidecars=embed_sidecars, progress_callback=progress, verify=verify,
+                          stream_merge=stream_merge, staging_dir=staging_dir).run()
+    return handle
+
+def _iter_video_urls(urls: Iterable[str], cookies_path: str | None = None) -> Iterator[str]:
+    # Playlists and channels become their videos (flat, page by page); a URL without entries is a single video
+    from channel_sync import uploads_url
+    from video_record import iter_flat_entries
+    for url in urls:
+        found = False
+        try:
+            for entry in iter_flat_entries(uploads_url(url), cookies_path):
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if entry_url:
+                    found = True
+                    yield entry_url
+        except Exception as e:
+            # Probing the URL itself reports the error
+            log.debug(f"[queue_worker] Could not expand {url}: {e}")
+        if not found:
+            yield url
+
+def enqueue_expanded(queue: JobQueueBackend, urls: Iterable[str], payload: dict, workers: int | None = None) -> list[tuple[int, str, str]]:
+    """Queue one job per video of urls, expanding playlists and channels, and return (job_id, url, title) tuples.
+
+    Every video is probed first in an extract_pool.ExtractionPool, so the
+    extractions run in parallel processes and unavailable or private entries are
+    reported and skipped here instead of becoming failed jobs. Listing and
+    probing use the cookies file the workers download with, so entries that
+    need it are not mistaken for unavailable ones.
+    """
+    from extract_pool import ExtractionPool
+    cookies_path = get_cookies_file_path()
+    queued = []
+    with ExtractionPool(workers, cookies_path) as pool:
+        for url, record in pool.imap(_iter_video_urls(urls, cookies_path)):
+            if isinstance(record, Exception):
+                log.warning(f"[queue_worker] Skipping {url}: {record}")
+                record_error(record, "warning", f"Could not probe {url}", __file__)
+                continue
+            job_url = record.url or url
+            queued.append((queue.enqueue({**payload, 'url': job_url}), job_url, record.title))
+    return queued
+
+def run_workers(workers: list[QueueWorker], exit_when_empty: bool = False, dashboard=None):
+    """Run workers on background threads; with a dashboard.JobDashboard it runs on this thread until closed."""
+    threads = [threading.Thread(target=w.run, kwargs={'exit_when_empty': exit_when_empty}, name=w.worker_id, daemon=True) for w in workers]
+    for t in threads:
+        t.start()
+
+    def stop_all():
+        for w in workers:
+            w.stop()
+
+    try:
+        if dashboard is not None:
+            dashboard.run(on_close=stop_all)
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+    except KeyboardInterrupt:
+        stop_all()
+        raise
+
+def main(argv: list[str] | None = None):
+    """Command line entry point: enqueue jobs, run a worker or show queue status."""
+    parser = argparse.ArgumentParser(description="Shared download queue for several worker hosts.")
+    parser.add_argument('--queue', default='yt_downloader_jobs.db', help="Queue path (SQLite) or '<scheme>://<location>' URL.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = sub.add_parser('enqueue', help="Add download jobs to the queue.")
+    enqueue.add_argument('urls', nargs='+')
+    enqueue.add_argument('--format', default='mp4', choices=['mp4', 'mp3', 'm4a', 'opus'])
+    enqueue.add_argument('--quality', default='', help="e.g. '1080p' or '192kbps'; empty for best.")
+    enqueue.add_argument('--expand', action='store_true', help="Queue every video of playlists/channels, probing them in parallel first.")
+    enqueue.add_argument('--probe-workers', type=int, default=None, help="Processes probing videos with --expand (default: CPU count).")
+
+    work = sub.add_parser('work', help="Run a worker that processes jobs from the queue.")
+    work.add_argument('--directory', required=True, help="Directory downloads are written to.")
+    work.add_argument('--worker-id', default=None)
+    work.add_argument('--lease', type=float, default=120.0, help="Lease length in seconds.")
+    work.add_argument('--exit-when-empty', action='store_true')
+    work.add_argument('--profile-dir', default=None, help="Write per-job profiles (pstats, collapsed stacks, memory) here.")
+    work.add_argument('--verify', action='store_true', help="Check duration and stream count of each finished file.")
+    work.add_argument('--error-report', default=None, help="Write the errors of this run (with tracebacks) to a JSON file.")
+    work.add_argument('--concurrency', type=int, default=1, help="Jobs run at the same time by this process.")
+    work.add_argument('--dashboard', action='store_true', help="Show a window with the progress of all jobs.")
+    work.add_argument('--segment-transcode', action='store_true')
+    work.add_argument('--staging-dir', default=os.environ.get(STAGING_DIR_ENV), help="Fast local directory for in-flight work; finished files are moved to --directory.")
+    work.add_argument('--stream-merge', action='store_true', help="Mux mp4 video and audio while downloading, without intermediate files.")
+    work.add_argument('--sidecars', default='', help="Comma separated: thumbnail,subtitles,infojson.")
+    work.add_argument('--embed-sidecars', action='store_true', help="Embed thumbnail/subtitles into the media file.")
+
+    sync = sub.add_parser('sync', help="Queue the new uploads of channels since their last sync.")
+    sync.add_argument('urls', nargs='*')
+    sync.add_argument('--sources-file', default=None, help="File with one channel, channel tab or uploads playlist URL per line.")
+    sync.add_argument('--watermarks', default='yt_downloader_sync.db', help="SQLite file holding the per-source watermarks.")
+    sync.add_argument('--all', action='store_true', help="Also sync every source that has a stored watermark.")
+    sync.add_argument('--backfill', type=int, default=0, help="Newest uploads to queue on a source's first sync.")
+    sync.add_argument('--format', default='mp4', choices=['mp4', 'mp3', 'm4a', 'opus'])
+    sync.add_argument('--quality', default='', help="e.g. '1080p' or '192kbps'; empty for best.")
+
+    sub.add_parser('status', help="Show job counts per status.")
+
+    args = parser.parse_args(argv)
+    queue = open_queue(args.queue)
+
+    if args.command == 'enqueue':
+        payload = {'format': args.format, 'quality': args.quality}
+        if args.expand:
+            collect_errors()
+            for job_id, url, title in enqueue_expanded(queue, args.urls, payload, args.probe_workers):
+                print(f"{job_id}\t{url}\t{title}")
+            if len(collector):
+                print(collector.format_report(), file=sys.stderr)
+        else:
+            for url in args.urls:
+                job_id = queue.enqueue({**payload, 'url': url})
+                print(f"{job_id}\t{url}")
+    elif args.command == 'work':
+        if not os.path.isdir(args.directory):
+            parser.error(f"Not a directory: {args.directory}")
+        if args.profile_dir:
+            enable_profiling(args.profile_dir)
+        try:
+            sidecars = parse_sidecar_kinds(args.sidecars)
+        except ValueError as e:
+            parser.error(str(e))
+        # A failing job is recorded and marked failed; the worker moves on and reports all errors at the end
+        collect_errors()
+        handler = download_handler(args.directory, args.segment_transcode, sidecars, args.embed_sidecars, args.verify, args.stream_merge, args.staging_dir)
+        worker_id = args.worker_id or default_worker_id()
+        state, dashboard = None, None
+        if args.dashboard:
+            from dashboard import JobDashboard, JobStateStore
+            state = JobStateStore()
+            dashboard = JobDashboard(state, lambda: "Queue: " + ", ".join(f"{k} {v}" for k, v in queue.counts().items()))
+        workers = [
+            QueueWorker(queue, handler, f"{worker_id}-{n}" if args.concurrency > 1 else worker_id, args.lease, state=state)
+            for n in range(max(1, args.concurrency))
+        ]
+        try:
+            run_workers(workers, args.exit_when_empty, dashboard)
+        except KeyboardInterrupt:
+            log.info("[queue_worker] Interrupted; unfinished lease will expire and be reassigned.")
+            sys.exit(130)
+        finally:
+            if len(collector):
+                log.warning(f"[queue_worker] {collector.format_report()}")
+                print(collector.format_report(), file=sys.stderr)
+            if args.error_report:
+                collector.write_json(args.error_report)
+    elif args.command == 'sync':
+        from channel_sync import WatermarkStore, sync_sources, sync_url
+        store = WatermarkStore(args.watermarks)
+        sources = list(args.urls)
+        if args.sources_file:
+            with open(args.sources_file, encoding='utf-8') as f:
+                sources += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        if args.all:
+            sources += store.sources()
+        if not sources:
+            parser.error("No sources given.")
+        for source in sources:
+            try:
+                sync_url(source)
+            except ValueError as e:
+                parser.error(str(e))
+        collect_errors()
+        queued = sync_sources(dict.fromkeys(sources), store, queue, {'format': args.format, 'quality': args.quality}, args.backfill,
+                              cookies_path=get_cookies_file_path())
+        for source, count in queued.items():
+            print(f"{count}\t{source}")
+        if len(collector):
+            print(collector.format_report(), file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'status':
+        for status, count in queue.counts().items():
+            print(f"{status}\t{count}")
+
+if __name__ == "__main__":
+    # Needed by the extraction pool's worker processes in frozen Windows builds
+    multiprocessing.freeze_support()
+    main()
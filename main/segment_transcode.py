@@ -0,0 +1,172 @@
+# segment_transcode.py extracts audio for downloads and transcodes long audio on all cores in parallel.
+
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+from yt_dlp.utils import PostProcessingError
+
+from logging_setup import log
+from constants import SEGMENT_TRANSCODE_MIN_DURATION, SEGMENT_TRANSCODE_SEGMENT_SECONDS
+from ffmpeg_utils import FFmpegError, run_ffmpeg, probe_duration, probe_audio_stream, probe_first_packet_time
+from integrity import PIPE_MUXERS, postprocessor_args, write_ffmpeg_output
+from profiling import profiled
+
+# Samples per encoded frame for the encoders that can be split and re-joined frame-exactly
+FRAME_SAMPLES = {
+    'libmp3lame': 1152,
+    'aac': 1024,
+    'libfdk_aac': 1024,
+    'libopus': 960,
+}
+
+# Extra encoder options needed so every frame decodes on its own (no MP3 bit reservoir across the joins)
+FRAME_INDEPENDENT_ARGS = {
+    'libmp3lame': ['-reservoir', '0'],
+}
+
+# Frames each segment encodes before its own start so the encoder is warmed up at the join
+PREROLL_FRAMES = 8
+
+def _quote_concat_path(path: str) -> str:
+    # Escape a path for the ffmpeg concat demuxer list file
+    return "'" + path.replace("'", "'\\''") + "'"
+
+def _encode_segment(src: str, seg_path: str, start: float, length: float | None, codec: str, codec_args: list[str], sample_rate: int, ffmpeg_path: str | None, ffprobe_path: str | None) -> float:
+    # Encode one segment with its own ffmpeg process and return the pts of its first packet
+    args = ['-ss', f"{start:.6f}"]
+    if length is not None:
+        args += ['-t', f"{length:.6f}"]
+    args += ['-i', src, '-map', '0:a:0', '-vn', '-c:a', codec, *FRAME_INDEPENDENT_ARGS.get(codec, []), *codec_args, '-ar', str(sample_rate), seg_path]
+    run_ffmpeg(args, ffmpeg_path)
+    return probe_first_packet_time(seg_path, ffprobe_path)
+
+def transcode_segmented(
+    src: str,
+    dst: str,
+    codec: str,
+    codec_args: list[str],
+    ffmpeg_path: str | None = None,
+    ffprobe_path: str | None = None,
+    segment_seconds: float = SEGMENT_TRANSCODE_SEGMENT_SECONDS,
+    workers: int | None = None,
+    hash_output: bool = False,
+) -> tuple[str, int] | None:
+    """Transcode the audio of src into dst by encoding fixed-length segments in parallel.
+
+    Segment boundaries fall on encoder frame boundaries. Every segment after the
+    first starts encoding a few frames early and those warm-up frames are dropped
+    again when the segments are joined with the concat demuxer (stream copy),
+    so the output has no gaps or overlaps at the joins.
+    With hash_output, returns (sha256, size) of dst if it could be hashed while written; otherwise None.
+    """
+    if codec not in FRAME_SAMPLES:
+        raise FFmpegError(f"Segmented transcoding is not supported for codec: {codec}")
+
+    duration = probe_duration(src, ffprobe_path)
+    stream = probe_audio_stream(src, ffprobe_path)
+    if not duration:
+        raise FFmpegError(f"Could not determine duration of {src}")
+    sample_rate = 48000 if codec == 'libopus' else int(stream.get('sample_rate') or 48000)
+
+    frame_duration = FRAME_SAMPLES[codec] / sample_rate
+    frames_per_segment = max(1, round(segment_seconds / frame_duration))
+    segment_length = frames_per_segment * frame_duration
+    count = math.ceil(duration / segment_length)
+    if count < 2:
+        return write_ffmpeg_output(['-i', src, '-vn', '-c:a', codec, *codec_args], dst, ffmpeg_path, hash_output=hash_output)
+
+    workers = workers or os.cpu_count() or 1
+    ext = os.path.splitext(dst)[1] or '.mka'
+    workdir = tempfile.mkdtemp(prefix='.segments-', dir=os.path.dirname(os.path.abspath(dst)))
+    log.info(f"[segment_transcode] Transcoding {src} as {count} segments of {segment_length:.1f}s with {workers} workers.")
+    try:
+        # Each segment runs in its own ffmpeg process; the threads only wait on them
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for i in range(count):
+                preroll = PREROLL_FRAMES if i > 0 else 0
+                start = i * segment_length - preroll * frame_duration
+                length = None if i == count - 1 else (preroll + frames_per_segment) * frame_duration
+                seg_path = os.path.join(workdir, f"seg{i:05d}{ext}")
+                futures.append((seg_path, preroll, pool.submit(
+                    _encode_segment, src, seg_path, start, length, codec, codec_args, sample_rate, ffmpeg_path, ffprobe_path,
+                )))
+            segments = [(seg_path, preroll, future.result()) for seg_path, preroll, future in futures]
+
+        # Keep frames [preroll, preroll + frames_per_segment) of each segment; half a frame of slack absorbs rounding
+        list_path = os.path.join(workdir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for i, (seg_path, preroll, first_pts) in enumerate(segments):
+                f.write(f"file {_quote_concat_path(seg_path)}\n")
+                if preroll:
+                    f.write(f"inpoint {first_pts + (preroll - 0.5) * frame_duration:.6f}\n")
+                if i < count - 1:
+                    f.write(f"outpoint {first_pts + (preroll + frames_per_segment - 0.5) * frame_duration:.6f}\n")
+        digest = write_ffmpeg_output(['-f', 'concat', '-safe', '0', '-i', list_path, '-map', '0:a', '-c', 'copy'], dst, ffmpeg_path, hash_output=hash_output)
+        log.info(f"[segment_transcode] Joined {count} segments into {dst}")
+        return digest
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+class ExtractAudioPP(FFmpegExtractAudioPP):
+    """FFmpegExtractAudio that hashes its output while writing it and can transcode long inputs segment-parallel.
+
+    With segmented=True, transcodes of inputs at least min_duration long are split
+    across cores; stream copies and short clips take the single-job path.
+    With on_output, the final file is hashed while it is written (for the
+    containers in PIPE_MUXERS) and on_output(path, sha256, size) is called;
+    without it, ffmpeg writes the file as yt_dlp would. A bitrate target above the source stream's bitrate is
+    lowered to the source bitrate, since encoding up only wastes space.
+    """
+    def __init__(self, downloader=None, preferredcodec=None, preferredquality=None, nopostoverwrites=False,
+                 segmented: bool = False,
+                 on_output: Callable[[str, str, int], None] | None = None,
+                 min_duration: float = SEGMENT_TRANSCODE_MIN_DURATION,
+                 segment_seconds: float = SEGMENT_TRANSCODE_SEGMENT_SECONDS,
+                 workers: int | None = None):
+        super().__init__(downloader, preferredcodec, preferredquality, nopostoverwrites)
+        self._segmented = segmented
+        self._on_output = on_output
+        self._min_duration = min_duration
+        self._segment_seconds = segment_seconds
+        self._workers = workers
+        self._requested_quality = self._preferredquality
+        self._duration = None
+        self._digest = None
+
+    @profiled('postprocess', job=lambda self, information: information.get('webpage_url') or information.get('id', ''))
+    def run(self, information):
+        self._duration = information.get('duration')
+        self._digest = None
+        self._preferredquality = self._requested_quality
+        abr = information.get('abr')
+        if self._preferredquality is not None and self._preferredquality > 10 and abr and abr < self._preferredquality:
+            log.info(f"[segment_transcode] Source is {abr:.0f} kbps; encoding at that instead of {self._preferredquality:.0f} kbps.")
+            self._preferredquality = round(abr)
+        files_to_delete, information = super().run(information)
+        # The output was renamed to information['filepath'] after run_ffmpeg; renaming keeps the digest valid
+        if self._digest and self._on_output:
+            self._on_output(information['filepath'], *self._digest)
+        return files_to_delete, information
+
+    def run_ffmpeg(self, path, out_path, codec, more_opts):
+        if self._segmented and codec in FRAME_SAMPLES and self._duration and self._duration >= self._min_duration:
+            try:
+                self._digest = transcode_segmented(path, out_path, codec, list(more_opts), self.executable, self.probe_executable,
+                                                   self._segment_seconds, self._workers, hash_output=self._on_output is not None)
+                return
+            except FFmpegError as e:
+                log.warning(f"[segment_transcode] Segmented transcode failed, falling back to a single ffmpeg job: {e}")
+        if self._on_output is None or os.path.splitext(out_path)[1].lower() not in PIPE_MUXERS:
+            return super().run_ffmpeg(path, out_path, codec, more_opts)
+        acodec_opts = ['-acodec', codec] if codec else []
+        try:
+            self._digest = write_ffmpeg_output(postprocessor_args(self, [path], ['-vn', *acodec_opts, *more_opts]), out_path,
+                                               self.executable, hash_output=True)
+        except FFmpegError as e:
+            raise PostProcessingError(f'audio conversion failed: {e}')
@@ -0,0 +1,161 @@
+# sidecars.py writes thumbnails, subtitles and the info JSON next to a download, in parallel with the media stream.
+
+import json
+import os
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import yt_dlp
+from yt_dlp.networking import Request
+
+from logging_setup import log
+from ffmpeg_utils import run_ffmpeg
+from integrity import write_ffmpeg_output
+from profiling import profiled
+
+SIDECAR_KINDS = ('thumbnail', 'subtitles', 'infojson')
+SUBTITLE_EXT_PREFERENCE = ('vtt', 'srt')
+
+def parse_sidecar_kinds(value: str | None) -> tuple[str, ...]:
+    """Parse a comma separated list such as 'thumbnail,subtitles' into sidecar kinds."""
+    if not value:
+        return ()
+    kinds = tuple(kind.strip().lower() for kind in value.split(',') if kind.strip())
+    for kind in kinds:
+        if kind not in SIDECAR_KINDS:
+            raise ValueError(f"Unknown sidecar kind: {kind}. Expected one of {', '.join(SIDECAR_KINDS)}")
+    return kinds
+
+def _fetch_to_file(ydl: yt_dlp.YoutubeDL, url: str, path: str, headers: dict | None = None) -> str:
+    # Stream a URL into a file through the YoutubeDL, so its cookies, proxy and TLS settings apply
+    with ydl.urlopen(Request(url, headers=headers or {})) as response, open(path, 'wb') as f:
+        shutil.copyfileobj(response, f)
+    return path
+
+def _thumbnail_source(info: dict, base_path: str) -> tuple[str, str] | None:
+    # yt-dlp sorts thumbnails by preference, best last
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    if not thumbnails:
+        log.debug("[sidecars] No thumbnail available.")
+        return None
+    url = thumbnails[-1]['url']
+    ext = os.path.splitext(url.split('?', 1)[0])[1].lstrip('.') or 'jpg'
+    return url, f"{base_path}.{ext}"
+
+def _subtitle_sources(info: dict, base_path: str, langs: tuple[str, ...]) -> dict[str, tuple[str, str]]:
+    # Prefer uploaded subtitles over automatic captions for each requested language
+    sources = {}
+    for lang in langs:
+        tracks = (info.get('subtitles') or {}).get(lang) or (info.get('automatic_captions') or {}).get(lang) or []
+        track = next((t for ext in SUBTITLE_EXT_PREFERENCE for t in tracks if t.get('ext') == ext and t.get('url')), None)
+        if track is None:
+            log.debug(f"[sidecars] No subtitles for language: {lang}")
+            continue
+        sources[lang] = (track['url'], f"{base_path}.{lang}.{track['ext']}")
+    return sources
+
+def _fetch_subtitles(ydl: yt_dlp.YoutubeDL, sources: dict[str, tuple[str, str]], headers: dict | None) -> dict[str, str]:
+    return {lang: _fetch_to_file(ydl, url, path, headers) for lang, (url, path) in sources.items()}
+
+def _write_text(text: str, path: str) -> str:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+class SidecarFetch:
+    """Fetches the requested sidecars on background threads from an already extracted info dict.
+
+    Everything needed from the info dict is read up front, because yt-dlp keeps
+    modifying it while the media downloads.
+    """
+    def __init__(self, ydl: yt_dlp.YoutubeDL, info: dict, base_path: str, kinds: tuple[str, ...], subtitle_langs: tuple[str, ...] = ('en',)):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(kinds)), thread_name_prefix='sidecar')
+        self._futures: dict[str, Future] = {}
+        headers = dict(info.get('http_headers') or {})
+        if 'thumbnail' in kinds and (source := _thumbnail_source(info, base_path)):
+            self._futures['thumbnail'] = self._pool.submit(_fetch_to_file, ydl, *source, headers)
+        if 'subtitles' in kinds and (sources := _subtitle_sources(info, base_path, subtitle_langs)):
+            self._futures['subtitles'] = self._pool.submit(_fetch_subtitles, ydl, sources, headers)
+        if 'infojson' in kinds:
+            text = json.dumps({k: v for k, v in info.items() if not k.startswith('_')}, ensure_ascii=False, default=str)
+            self._futures['infojson'] = self._pool.submit(_write_text, text, f"{base_path}.info.json")
+        log.info(f"[sidecars] Fetching sidecars {list(self._futures)} for {base_path}")
+
+    def results(self) -> dict:
+        """Wait for all sidecars and return {kind: path or {lang: path}}; failed sidecars are logged and left out."""
+        results = {}
+        for kind, future in self._futures.items():
+            try:
+                value = future.result()
+            except Exception as e:
+                log.warning(f"[sidecars] Could not write {kind}: {e}")
+                continue
+            if value:
+                results[kind] = value
+        self._pool.shutdown()
+        return results
+
+    def discard(self):
+        """Wait for all sidecars and delete the ones that were written; used when the media download failed."""
+        for value in self.results().values():
+            for path in value.values() if isinstance(value, dict) else [value]:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    log.warning(f"[sidecars] Could not remove {path}: {e}")
+        log.info("[sidecars] Removed sidecars of the failed download.")
+
+@profiled('embed', job=lambda media_path, *args, **kwargs: media_path)
+def embed_sidecars(media_path: str, sidecars: dict, ffmpeg_path: str | None = None,
+                   on_output: Callable[[str, str, int], None] | None = None) -> bool:
+    """Embed the thumbnail (as cover art) and subtitles into the media file with a stream-copy remux.
+
+    Subtitles are only embedded into MP4; Opus/Ogg files get neither. With
+    on_output (verification), the new file is hashed while it is written and
+    reported as on_output(path, sha256, size), except for MP3 and for MP4 with
+    cover art, which cannot be written through a pipe intact. Returns True if
+    the file was rewritten.
+    """
+    ext = os.path.splitext(media_path)[1].lower()
+    thumbnail = sidecars.get('thumbnail') if ext in ('.mp4', '.m4a', '.mp3') else None
+    subtitles = sidecars.get('subtitles', {}) if ext == '.mp4' else {}
+    if not thumbnail and not subtitles:
+        return False
+
+    inputs = ['-i', media_path]
+    maps = ['-map', '0']
+    codecs = ['-c', 'copy']
+    index = 1
+    if thumbnail:
+        inputs += ['-i', thumbnail]
+        maps += ['-map', f'{index}:v:0']
+        # Cover art must be JPEG in MP4/MP3; it is the only stream that gets encoded
+        stream = 'v:1' if ext == '.mp4' else 'v:0'
+        codecs += [f'-c:{stream}', 'mjpeg', f'-disposition:{stream}', 'attached_pic']
+        index += 1
+    for n, (lang, path) in enumerate(subtitles.items()):
+        inputs += ['-i', path]
+        maps += ['-map', f'{index}:s:0']
+        codecs += [f'-metadata:s:s:{n}', f'language={lang}']
+        index += 1
+    if subtitles:
+        codecs += ['-c:s', 'mov_text']
+    if ext == '.mp3':
+        codecs += ['-id3v2_version', '3']
+
+    base, _ = os.path.splitext(media_path)
+    temp_path = f"{base}.embed{ext}"
+    if on_output is not None and not (ext == '.mp4' and thumbnail):
+        digest = write_ffmpeg_output([*inputs, *maps, *codecs], temp_path, ffmpeg_path, hash_output=True)
+    else:
+        if ext == '.mp4':
+            # Index up front, as yt_dlp's own merge writes it
+            codecs += ['-movflags', '+faststart']
+        run_ffmpeg([*inputs, *maps, *codecs, temp_path], ffmpeg_path)
+        digest = None
+    os.replace(temp_path, media_path)
+    if digest and on_output:
+        on_output(media_path, *digest)
+    log.info(f"[sidecars] Embedded thumbnail={bool(thumbnail)}, subtitles={list(subtitles)} into {media_path}")
+    return True
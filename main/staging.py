@@ -0,0 +1,134 @@
+# staging.py keeps in-flight download work on fast local scratch space and moves finished files to their destination.
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+
+from logging_setup import log
+
+STAGING_DIR_ENV = "YTDL_STAGING_DIR"
+COPY_CHUNK = 64 * 1024 * 1024
+
+# errno values that mean "this copy primitive cannot do it here", so the next one is tried
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+# errno values of os.link on another filesystem or one without hard links (FAT, some SMB shares)
+_NO_HARD_LINK = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+def make_staging_dir(root: str) -> str:
+    """Create a private work directory for one download under the staging root."""
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix='job-', dir=root)
+
+def _copy_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    # copy_file_range lets the kernel (or an NFS/SMB server) copy without passing the data through user space
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if copied or e.errno not in _UNSUPPORTED:
+            raise
+        return False
+    return copied == size
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> bool:
+    # sendfile still avoids the user-space copy; Linux accepts a regular file as the destination
+    if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+        return False
+    offset = 0
+    try:
+        while offset < size:
+            n = os.sendfile(dst_fd, src_fd, offset, min(COPY_CHUNK, size - offset))
+            if n == 0:
+                break
+            offset += n
+    except OSError as e:
+        if offset or e.errno not in _UNSUPPORTED:
+            raise
+        return False
+    return offset == size
+
+def _copy_file(src: str, dst: str) -> str:
+    # Copy src to dst with the cheapest primitive available; returns the name of the one used
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        for method, copy in (('copy_file_range', _copy_range), ('sendfile', _sendfile)):
+            if copy(fsrc.fileno(), fdst.fileno(), size):
+                break
+            # Start the next primitive from a clean slate
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+        else:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+            method = 'read/write'
+    shutil.copystat(src, dst)
+    return method
+
+def finalize_to_destination(src: str, directory: str) -> str:
+    """Move a finished file from the staging area into directory and return its new path.
+
+    On the same filesystem the file is hard-linked to its new name and the
+    staged name removed; the link fails if the name is taken, so two jobs can
+    never both claim it. Otherwise the name is claimed by creating it
+    exclusively, the file is copied to a .part file next to it (copy_file_range,
+    then sendfile, then plain read/write) and renamed over the claimed name, and
+    the staged copy is removed, so the destination never shows a half-written
+    file. An existing file at the destination is never replaced: FileExistsError
+    is raised and src is left in place.
+    """
+    dst = os.path.join(directory, os.path.basename(src))
+    if hasattr(os, 'link'):
+        try:
+            os.link(src, dst)
+        except FileExistsError:
+            raise FileExistsError(errno.EEXIST, "Destination file already exists", dst) from None
+        except OSError as e:
+            if e.errno not in _NO_HARD_LINK:
+                raise
+        else:
+            os.remove(src)
+            log.debug(f"[staging] Moved {src} to {dst}")
+            return dst
+    # No hard link possible: claim the name with an empty file, then put the data over it
+    try:
+        open(dst, 'xb').close()
+    except FileExistsError:
+        raise FileExistsError(errno.EEXIST, "Destination file already exists", dst) from None
+    part = f"{dst}.part"
+    try:
+        try:
+            os.replace(src, dst)
+            log.debug(f"[staging] Renamed {src} to {dst}")
+            return dst
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        method = _copy_file(src, part)
+        os.replace(part, dst)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        # Only the empty claim can be at dst here
+        os.remove(dst)
+        raise
+    os.remove(src)
+    log.info(f"[staging] Copied {src} to {dst} with {method}")
+    return dst
+
+if __name__ == "__main__":
+    # Example usage: stage a file and move it to a directory given on the command line (or another temp dir)
+    work_dir = make_staging_dir(os.path.join(tempfile.gettempdir(), 'yt-staging'))
+    staged = os.path.join(work_dir, 'example.bin')
+    with open(staged, 'wb') as f:
+        f.write(os.urandom(1024 * 1024))
+    destination = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    print(finalize_to_destination(staged, destination))
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,196 @@
+# stream_merge.py muxes the video and audio formats of a download into one mp4 while they are still downloading.
+
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+import yt_dlp
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, RequestError
+
+from logging_setup import log
+from ffmpeg_utils import FFmpegError
+from integrity import write_ffmpeg_output
+
+# Protocols that can be fetched with plain (ranged) GET requests; fragmented (DASH/HLS) formats take the classic path
+STREAMABLE_PROTOCOLS = ('http', 'https')
+READ_SIZE = 256 * 1024
+RANGE_RETRIES = 5
+
+_CONTENT_RANGE = re.compile(r'bytes \d+-\d+/(\d+)')
+
+def can_stream_merge(info: dict) -> bool:
+    """True if info selected separate video and audio formats that can be fetched directly into an mp4."""
+    formats = info.get('requested_formats') or []
+    return (
+        len(formats) == 2
+        and info.get('ext') == 'mp4'
+        and all(f.get('url') and f.get('protocol') in STREAMABLE_PROTOCOLS and not f.get('fragments') for f in formats)
+    )
+
+class _RangedSource:
+    # One format, fetched through the YoutubeDL in ranges of the format's http_chunk_size like yt-dlp's HTTP downloader
+    def __init__(self, ydl: yt_dlp.YoutubeDL, fmt: dict):
+        self.ydl = ydl
+        self.fmt = fmt
+        self.chunk_size = (fmt.get('downloader_options') or {}).get('http_chunk_size')
+        self.size: int | None = fmt.get('filesize')
+        self.received = 0
+        self.error: Exception | None = None
+        self.stopped = threading.Event()
+
+    def _open(self, start: int, end: int | None):
+        headers = {**(self.fmt.get('http_headers') or {}), 'Range': f"bytes={start}-{'' if end is None else end}"}
+        response = self.ydl.urlopen(Request(self.fmt['url'], headers=headers))
+        if start and response.status != 206:
+            response.close()
+            raise FFmpegError(f"format {self.fmt.get('format_id')}: server ignored the Range header")
+        if self.size is None:
+            match = _CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+            length = response.headers.get('Content-Length')
+            self.size = int(match.group(1)) if match else int(length) if length and response.status == 200 else None
+        return response
+
+    def chunks(self) -> Iterator[bytes]:
+        """Yield the format's bytes in order; a dropped range is resumed where it stopped."""
+        retries = 0
+        while not self.stopped.is_set() and (self.size is None or self.received < self.size):
+            start = self.received
+            end = start + self.chunk_size - 1 if self.chunk_size else None
+            if end is not None and self.size is not None:
+                end = min(end, self.size - 1)
+            try:
+                with self._open(start, end) as response:
+                    while not self.stopped.is_set() and (data := response.read(READ_SIZE)):
+                        self.received += len(data)
+                        yield data
+            except RequestError as e:
+                if isinstance(e, HTTPError) and e.status == 416 and self.size is None:
+                    # Asked past the end of a format of unknown size
+                    break
+                if isinstance(e, HTTPError) and e.status < 500:
+                    raise
+                retries += 1
+                if retries > RANGE_RETRIES:
+                    raise
+                log.warning(f"[stream_merge] Range {start}- of format {self.fmt.get('format_id')} failed ({e}); retry {retries}/{RANGE_RETRIES}")
+                self.stopped.wait(min(2 ** retries, 30))
+                continue
+            retries = 0
+            if self.received == start or end is None:
+                # Nothing more to read, or one unranged request was read to the end
+                break
+
+class _SourceHandler(BaseHTTPRequestHandler):
+    # Serves one _RangedSource per path to ffmpeg; no Accept-Ranges, so ffmpeg reads each input once from the start
+    def do_GET(self):
+        source = self.server.sources.get(self.path) # type: ignore
+        if source is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if source.size:
+            self.send_header('Content-Length', str(source.size))
+        self.end_headers()
+        try:
+            for data in source.chunks():
+                self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg stopped reading
+            source.stopped.set()
+        except Exception as e:
+            source.error = e
+
+    def log_message(self, format, *args):
+        log.debug(f"[stream_merge] {format % args}")
+
+def _raise_fetch_error(sources: list[_RangedSource], cause: Exception | None = None):
+    for source in sources:
+        if source.error is not None:
+            raise FFmpegError(f"fetching format {source.fmt.get('format_id')} failed: {source.error}") from (cause or source.error)
+
+def stream_merge(
+    info: dict,
+    dst: str,
+    ydl: yt_dlp.YoutubeDL,
+    ffmpeg_path: str | None = None,
+    progress_hook: Callable[[dict], None] | None = None,
+    hash_output: bool = False,
+) -> tuple[str, int] | None:
+    """Download the two requested formats of info and mux them into dst in a single ffmpeg pass.
+
+    Both formats are fetched through ydl (its cookies, proxy and headers) in
+    ranges of their http_chunk_size, as yt-dlp's own HTTP downloader does,
+    because YouTube throttles full-length requests. They are served to ffmpeg
+    over a loopback HTTP server, and ffmpeg stream-copies them into the mp4.
+    There are no full-size intermediate files and no separate merge step. The
+    mp4 gets its index up front (faststart), as from yt_dlp's merge; with
+    hash_output it is instead written fragmented through HashingWriter and
+    (sha256, size) is returned, else None. progress_hook receives yt_dlp-style
+    progress dicts. Raises FFmpegError on failure.
+    """
+    video, audio = info['requested_formats']
+    sources = [_RangedSource(ydl, video), _RangedSource(ydl, audio)]
+    total_estimate = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in (video, audio)) or None
+    root, ext = os.path.splitext(dst)
+    part = f"{root}.part{ext}"
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _SourceHandler)
+    server.daemon_threads = True
+    token = secrets.token_urlsafe(16)
+    server.sources = {f"/{token}/{n}": source for n, source in enumerate(sources)} # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True, name="stream-merge-server").start()
+    inputs = [arg for path in server.sources for arg in ('-seekable', '0', '-i', f"http://127.0.0.1:{server.server_port}{path}")] # type: ignore
+    log.info(f"[stream_merge] Streaming {video.get('format_id')}+{audio.get('format_id')} into {dst} "
+             f"(chunks: {', '.join(str(s.chunk_size or 'none') for s in sources)})")
+    started = time.monotonic()
+
+    def on_progress(_written: int):
+        if progress_hook:
+            received = sum(s.received for s in sources)
+            elapsed = time.monotonic() - started
+            speed = received / elapsed if elapsed > 0 else None
+            progress_hook({
+                'status': 'downloading',
+                'filename': dst,
+                'downloaded_bytes': received,
+                'total_bytes_estimate': total_estimate,
+                'speed': speed,
+                'eta': int((total_estimate - received) / speed) if speed and total_estimate and total_estimate > received else None,
+                'info_dict': info,
+            })
+
+    try:
+        try:
+            output_opts = [] if hash_output else ['-movflags', '+faststart']
+            digest = write_ffmpeg_output([*inputs, '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', *output_opts], part, ffmpeg_path,
+                                         on_progress, hash_output=hash_output)
+        except FFmpegError as e:
+            # A failed fetch explains ffmpeg's error better than ffmpeg does
+            _raise_fetch_error(sources, e)
+            raise
+        finally:
+            for source in sources:
+                source.stopped.set()
+            server.shutdown()
+            server.server_close()
+        # ffmpeg sees a failed fetch as a short input, so check that every format arrived in full
+        _raise_fetch_error(sources)
+        for source in sources:
+            if source.size is not None and source.received != source.size:
+                raise FFmpegError(f"format {source.fmt.get('format_id')} ended after {source.received} of {source.size} bytes")
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    os.replace(part, dst)
+    size = digest[1] if digest else os.path.getsize(dst)
+    log.info(f"[stream_merge] Finished {dst} ({size} bytes) in {time.monotonic() - started:.1f}s")
+    if progress_hook:
+        progress_hook({'status': 'finished', 'filename': dst, 'downloaded_bytes': size, 'total_bytes': size, 'info_dict': info})
+    return digest
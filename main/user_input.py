@@ -18,7 +18,7 @@ class YouTubeDownloaderGUI(ctk.CTk):
     """Minimal YouTube downloader GUI for user input."""
     def __init__(self):
         super().__init__()
-        self.geometry("450x450")
+        self.geometry("450x520")
         self.title("YouTube Downloader")
 
         self.video_url = ""
@@ -62,6 +62,8 @@ class YouTubeDownloaderGUI(ctk.CTk):
         ctk.CTkLabel(self.page2_format_selection, text="Select Download Format:", font=ROBOTO_TITLE_FONT_TUPLE).pack(pady=10)
 
         ctk.CTkButton(self.page2_format_selection, text="Download MP3 (Audio)", font=ROBOTO_NORMAL_FONT_TUPLE, command=lambda: self._select_format("mp3")).pack(pady=10)
+        ctk.CTkButton(self.page2_format_selection, text="Download M4A (Audio, no re-encode)", font=ROBOTO_NORMAL_FONT_TUPLE, command=lambda: self._select_format("m4a")).pack(pady=10)
+        ctk.CTkButton(self.page2_format_selection, text="Download Opus (Audio, no re-encode)", font=ROBOTO_NORMAL_FONT_TUPLE, command=lambda: self._select_format("opus")).pack(pady=10)
         ctk.CTkButton(self.page2_format_selection, text="Download MP4 (Video)", font=ROBOTO_NORMAL_FONT_TUPLE, command=lambda: self._select_format("mp4")).pack(pady=10)
         
         ctk.CTkButton(self.page2_format_selection, text="Back", font=ROBOTO_NORMAL_FONT_TUPLE, command=lambda: self._show_page(self.page1_link_input)).pack(pady=(20, 5))
@@ -141,7 +143,7 @@ class YouTubeDownloaderGUI(ctk.CTk):
         self.download_format = format_type
         log.info(f"Selected format: {self.download_format}")
 
-        if self.download_format == "mp3":
+        if self.download_format in ("mp3", "m4a", "opus"):
             if not self.available_audio_qualities:
                 self.page3_error_label.configure(text="No audio qualities found for this video.")
                 self.quality_combobox.set("No qualities available")
@@ -0,0 +1,87 @@
+# video_record.py holds the compact probe record and the yt-dlp calls that build it.
+# It imports neither logging_setup nor error_handler, so extraction worker processes can load it cheaply.
+
+import sys
+from dataclasses import dataclass
+
+import yt_dlp
+
+@dataclass(slots=True)
+class VideoInfo:
+    """Compact probe result holding only the fields the downloader needs."""
+    video_id: str
+    url: str
+    title: str
+    duration: float | None = None
+    upload_date: str | None = None
+    audio_qualities: tuple[str, ...] = ()
+    video_resolutions: tuple[str, ...] = ()
+
+def probe_opts(cookies_path: str | None = None) -> dict:
+    """Return yt-dlp options for info extraction only."""
+    ydl_opts = {
+        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
+        'listformats': True,
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+    }
+    if cookies_path:
+        ydl_opts['cookiefile'] = cookies_path
+    return ydl_opts
+
+def compact_info(info_dict: dict, url: str = "") -> VideoInfo:
+    """Reduce a full yt-dlp info dict to a VideoInfo record."""
+    audio_qualities = set()
+    video_resolutions = set()
+    for f in info_dict.get('formats') or []:
+        # Audio qualities (audio-only streams)
+        if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
+            abr = f.get('abr')
+            if abr:
+                audio_qualities.add(int(abr))
+        # Video resolutions (video streams, mp4 only)
+        if f.get('vcodec') != 'none':
+            height = f.get('height')
+            if height and f.get('ext') == 'mp4':
+                video_resolutions.add(int(height))
+    return VideoInfo(
+        video_id=info_dict.get('id') or '',
+        url=info_dict.get('webpage_url') or url,
+        title=info_dict.get('title') or '',
+        duration=info_dict.get('duration'),
+        upload_date=info_dict.get('upload_date'),
+        # Interned so thousands of records share one copy of each label
+        audio_qualities=tuple(sys.intern(f"{abr}kbps") for abr in sorted(audio_qualities, reverse=True)),
+        video_resolutions=tuple(sys.intern(f"{height}p") for height in sorted(video_resolutions, reverse=True)),
+    )
+
+def fetch_video_record(url: str, ydl: yt_dlp.YoutubeDL | None = None) -> VideoInfo:
+    """Probe a single video and return its compact record; the raw info dict is dropped right away.
+
+    Raises the yt-dlp error on failure. Pass a YoutubeDL to reuse it across probes.
+    """
+    if ydl is None:
+        with yt_dlp.YoutubeDL(probe_opts()) as ydl:
+            return fetch_video_record(url, ydl)
+    info_dict = ydl.extract_info(url, download=False)
+    if isinstance(info_dict, dict) and 'entries' in info_dict: # Playlist/channel
+        info_dict = next(iter(info_dict['entries']))
+    record = compact_info(info_dict, url) # type: ignore
+    del info_dict
+    return record
+
+def iter_flat_entries(url: str, cookies_path: str | None = None):
+    """Yield the flat entries (id, url, title, ...) of a playlist or channel tab in site order.
+
+    Pages are fetched lazily, so a caller that stops early never loads the rest.
+    """
+    ydl_opts = probe_opts(cookies_path)
+    ydl_opts['listformats'] = False
+    ydl_opts['extract_flat'] = 'in_playlist'
+    ydl_opts['lazy_playlist'] = True
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        playlist = ydl.extract_info(url, download=False, process=False)
+        entries = (playlist or {}).get('entries') or []
+        del playlist
+        yield from entries
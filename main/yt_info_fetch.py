@@ -4,6 +4,8 @@ import yt_dlp
 from logging_setup import log
 from error_handler import gather_info
 import sys, os
+from video_record import fetch_video_record, iter_flat_entries, probe_opts
+from profiling import profiled
 
 def get_cookies_file_path():
     """Return path to cookies file if it exists, else None."""
@@ -15,6 +17,32 @@ def get_cookies_file_path():
     log.debug("yt_info_fetch: No cookies file found.")
     return None
 
+def _iter_playlist_urls(url: str):
+    # Walk the playlist/channel lazily with flat entries (id and url only)
+    for entry in iter_flat_entries(url, get_cookies_file_path()):
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if entry_url:
+            yield entry_url
+
+def iter_playlist_records(url: str, pool=None):
+    """Yield a VideoInfo for every entry of a playlist or channel, holding one raw info dict at a time.
+
+    With an extract_pool.ExtractionPool the entries are probed in parallel worker
+    processes; entries that fail there are logged and skipped.
+    """
+    log.info(f"[yt_info_fetch] Expanding playlist: {url}")
+    if pool is not None:
+        for entry_url, record in pool.imap(_iter_playlist_urls(url)):
+            if isinstance(record, Exception):
+                log.warning(f"[yt_info_fetch] Could not probe {entry_url}: {record}")
+                continue
+            yield record
+        return
+    with yt_dlp.YoutubeDL(probe_opts(get_cookies_file_path())) as probe_ydl:
+        for entry_url in _iter_playlist_urls(url):
+            yield fetch_video_record(entry_url, probe_ydl)
+
+@profiled('probe', job=lambda url: url)
 def fetch_youtube_video_info(url: str):
     """Fetch video title, available audio qualities, and video resolutions for a YouTube URL."""
     log.info(f"[yt_info_fetch] Fetching video info for: {url}")
@@ -24,26 +52,12 @@ def fetch_youtube_video_info(url: str):
     else:
         log.debug("[yt_info_fetch] yt_dlp will not use a cookies file.")
 
-    video_title = ""
-    audio_qualities = []
-    video_resolutions = []
     e = ""
 
     try:
-        # yt-dlp options for info extraction only
-        ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
-            'listformats': True,
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-        }
-        if cookies_path:
-            ydl_opts['cookiefile'] = cookies_path
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with yt_dlp.YoutubeDL(probe_opts(cookies_path)) as ydl:
             try:
-                info_dict = ydl.extract_info(url, download=False)
+                record = fetch_video_record(url, ydl)
             except yt_dlp.utils.ExtractorError as e:
                 if 'cookies' in str(e).lower():
                     log.error(f"Cookies are required but not provided for {url}: {e}")
@@ -52,29 +66,7 @@ def fetch_youtube_video_info(url: str):
                 else:
                     raise
 
-            if isinstance(info_dict, dict) and 'entries' in info_dict: # Playlist/channel
-                info_dict = info_dict['entries'][0]
-
-            video_title = info_dict.get('title', '') # type: ignore
-            formats = info_dict.get('formats', []) # type: ignore
-
-            for f in formats:
-                # Audio qualities (audio-only streams)
-                if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
-                    abr = f.get('abr')
-                    if abr:
-                        audio_qualities.append(f"{int(abr)}kbps")
-                # Video resolutions (video streams, mp4 only)
-                if f.get('vcodec') != 'none':
-                    height = f.get('height')
-                    ext = f.get('ext')
-                    if height and ext == 'mp4':
-                        video_resolutions.append(f"{height}p")
-            # Remove duplicates and sort
-            audio_qualities = sorted(list(set(audio_qualities)), key=lambda x: int(x.replace('kbps', '')), reverse=True)
-            video_resolutions = sorted(list(set(video_resolutions)), key=lambda x: int(x.replace('p', '')), reverse=True)
-
-            return True, video_title, audio_qualities, video_resolutions, ""
+            return True, record.title, list(record.audio_qualities), list(record.video_resolutions), ""
 
     except yt_dlp.utils.DownloadError as e:
         log.error(f"yt-dlp DownloadError for {url}: {e}")
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+
+from job_queue import DONE, FAILED, LEASED, PENDING, SQLiteJobQueue
+
+JOBS = 60
+WORKERS = 4
+
+def _worker(path: str, worker_id: str, results):
+    # Leases and completes jobs until the queue is empty; reports every job it completed
+    queue = SQLiteJobQueue(path)
+    completed = []
+    while (job := queue.lease(worker_id, lease_seconds=30)) is not None:
+        if queue.complete(job.id, worker_id, {'worker': worker_id}):
+            completed.append(job.id)
+    results.put(completed)
+
+def test_each_job_is_leased_and_completed_once(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = SQLiteJobQueue(path)
+    job_ids = [queue.enqueue({'n': n}) for n in range(JOBS)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(path, f"worker-{n}", results)) for n in range(WORKERS)]
+    for p in workers:
+        p.start()
+    completed = [job_id for _ in workers for job_id in results.get(timeout=60)]
+    for p in workers:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    assert sorted(completed) == job_ids
+    assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: JOBS, FAILED: 0}
+    for job_id in job_ids:
+        job = queue.get(job_id)
+        assert job.attempts == 1
+        assert job.result == {'worker': job.worker_id}
+
+def test_expired_lease_goes_to_another_worker(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue({'n': 1})
+    assert queue.lease('a', lease_seconds=0.05).id == job_id
+    assert queue.lease('b', lease_seconds=30) is None
+    time.sleep(0.1)
+
+    job = queue.lease('b', lease_seconds=30)
+    assert job.id == job_id and job.worker_id == 'b' and job.attempts == 2
+    # The first worker no longer owns the job
+    assert not queue.heartbeat(job_id, 'a', 30)
+    assert not queue.complete(job_id, 'a', {})
+    assert queue.complete(job_id, 'b', {'ok': True})
+    assert queue.get(job_id).status == DONE
+
+def test_lease_expired_too_often_fails(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'), max_attempts=1)
+    job_id = queue.enqueue({'n': 1})
+    queue.lease('a', lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.lease('b', lease_seconds=30) is None
+    assert queue.get(job_id).status == FAILED
+
+def test_fail_terminal_state(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'), max_attempts=2)
+    final = queue.enqueue({'n': 1})
+    retried = queue.enqueue({'n': 2})
+
+    queue.lease('a', lease_seconds=30)
+    assert not queue.fail(final, 'b', "not the owner")
+    assert queue.fail(final, 'a', "broken", retry=False)
+    assert queue.get(final).status == FAILED
+    assert queue.get(final).error == "broken"
+
+    # A retried failure is pending again until the job used up its attempts
+    assert queue.lease('a', lease_seconds=30).id == retried
+    assert queue.fail(retried, 'a', "timed out", retry=True)
+    assert queue.get(retried).status == PENDING
+    job = queue.lease('b', lease_seconds=30)
+    assert job.id == retried and job.attempts == 2
+    assert queue.fail(retried, 'b', "timed out again", retry=True)
+    assert queue.get(retried).status == FAILED
+    assert queue.lease('c', lease_seconds=30) is None
+    assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 2}
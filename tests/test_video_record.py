@@ -0,0 +1,69 @@
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+
+from video_record import VideoInfo, compact_info
+
+ENTRIES = 500
+# Bytes a compact record may keep alive once its raw info dict is gone
+MAX_BYTES_PER_RECORD = 2048
+
+def _synthetic_info(i: int) -> dict:
+    # Shaped like a yt-dlp info dict: many formats with headers, thumbnails and caption tracks
+    headers = {'User-Agent': 'Mozilla/5.0 ' + 'x' * 100, 'Accept': '*/*', 'Accept-Language': 'en-us,en;q=0.5'}
+    formats = []
+    for n, (height, abr) in enumerate([(144, None), (240, None), (360, None), (480, None), (720, None), (1080, None), (1440, None), (2160, None),
+                                       (None, 48), (None, 70), (None, 128), (None, 160)]):
+        formats.append({
+            'format_id': str(100 + n),
+            'url': f"https://rr1---sn-example.googlevideo.com/videoplayback?id={i}&itag={100 + n}&" + 'sig=' + 'a' * 400,
+            'ext': 'mp4' if height else 'm4a',
+            'height': height,
+            'vcodec': 'avc1.640028' if height else 'none',
+            'acodec': 'none' if height else 'mp4a.40.2',
+            'abr': abr,
+            'filesize': 10_000_000 + n,
+            'http_headers': dict(headers),
+            'fragments': [{'url': f"frag{k}", 'duration': 5.0} for k in range(20)],
+        })
+    return {
+        'id': f"video{i:06d}",
+        'webpage_url': f"https://www.youtube.com/watch?v=video{i:06d}",
+        'title': f"Example video number {i}",
+        'duration': 600 + i,
+        'upload_date': '20240101',
+        'description': 'd' * 2000,
+        'formats': formats,
+        'thumbnails': [{'url': f"https://i.ytimg.com/vi/video{i}/{k}.jpg", 'width': 120 * k, 'height': 90 * k} for k in range(1, 30)],
+        'subtitles': {lang: [{'ext': 'vtt', 'url': f"https://example.com/{lang}/{i}"}] for lang in ('en', 'de', 'fr', 'es', 'ja')},
+        'http_headers': dict(headers),
+    }
+
+def test_compact_info_keeps_needed_fields():
+    record = compact_info(_synthetic_info(1))
+    assert isinstance(record, VideoInfo)
+    assert record.video_id == 'video000001'
+    assert record.title == 'Example video number 1'
+    assert record.video_resolutions == ('2160p', '1440p', '1080p', '720p', '480p', '360p', '240p', '144p')
+    assert record.audio_qualities == ('160kbps', '128kbps', '70kbps', '48kbps')
+
+def test_memory_per_record_is_bounded():
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        records = []
+        for i in range(ENTRIES):
+            info = _synthetic_info(i)
+            records.append(compact_info(info))
+            del info
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    per_record = (current - baseline) / ENTRIES
+    assert len(records) == ENTRIES
+    assert per_record < MAX_BYTES_PER_RECORD, f"{per_record:.0f} bytes per record"